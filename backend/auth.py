@@ -1,5 +1,8 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+import threading
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import bcrypt as _bcrypt
@@ -11,6 +14,17 @@ import os
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
+# bcrypt cost factor for new password hashes. Raising or lowering it doesn't
+# invalidate existing hashes - each is redone at the new cost the next time
+# its user logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Tokens already verified, so the console's bids and lot changes don't each
+# pay for a full HMAC check. A token is only cached once it has verified,
+# and only until its own expiry.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "256"))
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
 
 security = HTTPBearer()
 
@@ -23,9 +37,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return _bcrypt.hashpw(
         password.encode("utf-8"),
-        _bcrypt.gensalt(),
+        _bcrypt.gensalt(rounds=BCRYPT_ROUNDS),
     ).decode("utf-8")
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made at a cost other than BCRYPT_ROUNDS. The cost
+    is the third field of the hash: $2b$12$..."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -36,48 +58,84 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def decode_token(token: str) -> Optional[str]:
+    """The username a valid, unexpired token was issued to, or None."""
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+        if cached is not None:
+            username, expires_at = cached
+            if time.time() < expires_at:
+                _token_cache.move_to_end(token)
+                return username
+            del _token_cache[token]
 
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        return {"username": username}
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except InvalidTokenError:
-        raise credentials_exception
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+
+    expires_at = payload.get("exp")
+    if TOKEN_CACHE_SIZE > 0 and expires_at is not None:
+        with _token_cache_lock:
+            _token_cache[token] = (username, expires_at)
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return username
 
-def authenticate_user(username: str, password: str, db: Session) -> bool:
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    username = decode_token(credentials.credentials)
+    if username is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"username": username}
+
+# The user functions below take password hashes rather than passwords:
+# bcrypt is deliberately slow, so callers hash on the login_guard pool and
+# keep it off the DB threads.
+
+def get_user_password_hash(username: str, db: Session) -> Optional[str]:
     from database import User
-    user = db.query(User).filter(User.username == username).first()
-    return bool(user and verify_password(password, user.password_hash))
+    row = db.query(User.password_hash).filter(User.username == username).first()
+    return row[0] if row else None
+
+def rehash_user_password(username: str, old_hash: str, new_hash: str, db: Session) -> bool:
+    """Swap in a re-costed hash of the same password - unless the password
+    was changed since `old_hash` was read, which must win."""
+    from database import User
+    updated = (
+        db.query(User)
+        .filter(User.username == username, User.password_hash == old_hash)
+        .update({User.password_hash: new_hash}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(updated)
 
-def create_user(username: str, password: str, db: Session) -> bool:
+def create_user(username: str, password_hash: str, db: Session) -> bool:
     from database import User
 
     existing_user = db.query(User).filter(User.username == username).first()
     if existing_user:
         return False
 
-    password_hash = get_password_hash(password)
     user = User(username=username, password_hash=password_hash, is_admin=True)
     db.add(user)
     db.commit()
     return True
 
-def change_user_password(username: str, new_password: str, db: Session) -> bool:
+def change_user_password(username: str, password_hash: str, db: Session) -> bool:
     from database import User
 
     user = db.query(User).filter(User.username == username).first()
     if not user:
         return False
 
-    user.password_hash = get_password_hash(new_password)
+    user.password_hash = password_hash
     db.commit()
     return True
 
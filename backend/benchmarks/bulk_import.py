@@ -0,0 +1,85 @@
+"""Buyer List import throughput: the bulk engine against the old
+row-by-row loop, on generated sheets of 10k rows by default.
+
+    cd backend && python benchmarks/bulk_import.py [rows ...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+# database.py builds its engine at import time - point it at a scratch DB first.
+_scratch_dir = tempfile.mkdtemp(prefix="auction-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch_dir}/bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import pandas as pd
+
+from bulk_import import import_buyer_list
+from database import Base, Buyer, SessionLocal, engine
+
+
+def _buyer_sheet(rows: int, renamed_every: int = 0) -> pd.DataFrame:
+    names = [f"Buyer Name {i}" for i in range(rows)]
+    if renamed_every:
+        for i in range(0, rows, renamed_every):
+            names[i] += " (renamed)"
+    return pd.DataFrame({"Identifier": np.arange(1, rows + 1), "Name": names})
+
+
+def _row_by_row_import(db, df: pd.DataFrame):
+    # The per-row ORM loop upload_buyer_list used before the bulk engine.
+    df = df.replace({np.nan: None})
+    existing_buyers = {buyer.identifier: buyer for buyer in db.query(Buyer).all()}
+    added_count = updated_count = 0
+    for _, row in df.iterrows():
+        identifier_value = row.get("Identifier")
+        if identifier_value is None or pd.isna(identifier_value):
+            identifier_value = 0
+        identifier_int = int(identifier_value)
+        name_str = str(row.get("Name", ""))
+        if identifier_int in existing_buyers:
+            if existing_buyers[identifier_int].name != name_str:
+                existing_buyers[identifier_int].name = name_str
+                updated_count += 1
+        else:
+            db.add(Buyer(identifier=identifier_int, name=name_str))
+            added_count += 1
+    db.flush()
+    return added_count, updated_count
+
+
+def _time_import(import_fn, sheets) -> list:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    timings = []
+    for label, df in sheets:
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            added, updated = import_fn(db, df)
+            db.commit()
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+        timings.append({"phase": label, "seconds": round(elapsed, 4), "added": added, "updated": updated,
+                        "rows_per_second": round(len(df) / elapsed)})
+    return timings
+
+
+def run(rows: int = 10_000) -> dict:
+    """Fresh import of `rows` buyers, then a re-upload with every tenth
+    buyer renamed, through both import paths."""
+    sheets = [("fresh", _buyer_sheet(rows)), ("reupload", _buyer_sheet(rows, renamed_every=10))]
+    return {
+        "rows": rows,
+        "bulk": _time_import(import_buyer_list, sheets),
+        "row_by_row": _time_import(_row_by_row_import, sheets),
+    }
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000]
+    print(json.dumps([run(rows) for rows in sizes], indent=2))
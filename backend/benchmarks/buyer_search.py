@@ -0,0 +1,71 @@
+"""Checks and times the bidder-entry autocomplete (buyer_index.py): a set of
+queries with known answers, including ones that must not be mistaken for
+bidder numbers, then the cost of a search against a large buyer list.
+Exits non-zero if any answer is wrong or /api/buyers/search fails.
+
+    cd backend && python benchmarks/buyer_search.py [buyers]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import harness
+from harness import AUTH_HEADERS, checked, percentiles
+
+from buyer_index import BuyerIndex
+
+BUYERS = {1: "Buyer 1", 12: "Ann Smith", 120: "Smithfield Farms", 3: "Café ²nd Street"}
+
+# (query, identifiers expected, in order)
+CASES = [
+    ("1", [1, 12, 120]),
+    ("12", [12, 120]),
+    ("012", []),
+    ("smi", [12, 120]),
+    ("ann smi", [12]),
+    # Digits outside ASCII pass str.isdigit() but aren't bidder numbers -
+    # they're searched for in names instead.
+    ("²", [3]),
+    ("١", []),
+    ("²nd", [3]),
+    ("  ", []),
+]
+
+
+def check_cases() -> list:
+    index = BuyerIndex(BUYERS)
+    failures = []
+    for query, expected in CASES:
+        found = [match["Identifier"] for match in index.search(query)]
+        if found != expected:
+            failures.append({"query": query, "expected": expected, "found": found})
+    return failures
+
+
+async def run(buyers: int = 20_000) -> dict:
+    failures = check_cases()
+
+    async with harness.client() as client:
+        await checked(client.post("/api/upload/buyer_list", headers=AUTH_HEADERS,
+                                  files={"file": ("buyers.xlsx", harness.xlsx_bytes(harness.buyer_sheet(buyers)))}))
+        for query, _ in CASES:
+            response = await client.get("/api/buyers/search", params={"q": query})
+            if response.status_code != 200:
+                failures.append({"query": query, "http_status": response.status_code})
+
+        timings = []
+        for i in range(2000):
+            query = str(i % buyers + 1) if i % 2 else f"buyer {i % buyers + 1}"
+            started = time.perf_counter()
+            await checked(client.get("/api/buyers/search", params={"q": query}))
+            timings.append(time.perf_counter() - started)
+
+    if failures:
+        raise SystemExit(f"Wrong search results: {json.dumps(failures, ensure_ascii=False)}")
+    return {"buyers": buyers, "cases": len(CASES), "search_request_ms": percentiles(timings)}
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    print(json.dumps(asyncio.run(run(*args)), indent=2))
@@ -0,0 +1,135 @@
+"""Shared setup for the in-process benchmarks: a scratch database, a stand-in
+FairEntry client, sheet builders and an ASGI client for the app. Import this
+before anything from the backend - database.py builds its engine at import
+time, so DATABASE_URL has to point at the scratch DB first."""
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+_scratch_dir = tempfile.mkdtemp(prefix="auction-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch_dir}/bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+import pandas as pd
+
+import fairentry_sync
+from auth import create_access_token
+from main import app
+
+
+class FakeFairEntryClient:
+    """Serves one Sale Order of `lots` entries and a list of `buyers` buyers
+    without touching the network. Set `renamed_every` to rename every n-th
+    exhibitor, as if they'd been edited upstream."""
+    lots = 0
+    buyers = 0
+    renamed_every = 0
+
+    def authenticate(self, username, password, fair_title):
+        pass
+
+    def get_buyers(self, refresh=False):
+        return [SimpleNamespace(identifier=str(i + 1), name=f"Buyer {i + 1}") for i in range(self.buyers)]
+
+    def get_sale_orders(self, refresh=False):
+        return [SimpleNamespace(id=1, name="Bench Sale", entry_count=self.lots)]
+
+    def get_sale_order(self, sale_order_id, refresh=False):
+        entries = [
+            SimpleNamespace(
+                id=i, sale_number=i + 1, department_name="Beef",
+                exhibitor_name=f"Exhibitor {i}" + (" (edited)" if self.renamed_every and i % self.renamed_every == 0 else ""),
+            )
+            for i in range(self.lots)
+        ]
+        return SimpleNamespace(entries_sorted_by_sale_number=lambda: entries, config=SimpleNamespace(name="Bench Sale"))
+
+
+fairentry_sync.FairEntryClient = FakeFairEntryClient
+
+AUTH_HEADERS = {"Authorization": f"Bearer {create_access_token(data={'sub': 'admin'})}"}
+
+
+def xlsx_bytes(df: pd.DataFrame) -> bytes:
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+def sale_sheet(lots: int, department: str = "Swine") -> pd.DataFrame:
+    return pd.DataFrame({
+        "Sale #": [str(i + 1) for i in range(lots)],
+        "Exhibitor": [f"Exhibitor {i}" for i in range(lots)],
+        "Department": [department] * lots,
+    })
+
+
+def buyer_sheet(buyers: int) -> pd.DataFrame:
+    return pd.DataFrame({"Identifier": range(1, buyers + 1), "Name": [f"Buyer {i + 1}" for i in range(buyers)]})
+
+
+def client() -> httpx.AsyncClient:
+    """An httpx client calling the app in process, on the caller's loop."""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+
+async def checked(response_coroutine):
+    response = await response_coroutine
+    response.raise_for_status()
+    return response
+
+
+class Display:
+    """A simulated /ws client, connected through the ASGI interface directly
+    (no sockets), that timestamps every frame it receives."""
+
+    def __init__(self):
+        self.frames = []
+        self._connected = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._accepted = False
+        self.task = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": "/ws", "raw_path": b"/ws",
+            "root_path": "", "query_string": b"", "headers": [], "subprotocols": [],
+            "client": ("bench", 0), "server": ("bench", 80),
+        }
+        self.task = asyncio.create_task(app(scope, self._receive, self._send))
+        await self._connected.wait()
+
+    async def close(self):
+        self._closed.set()
+        await self.task
+
+    async def _receive(self):
+        if not self._accepted:
+            self._accepted = True
+            return {"type": "websocket.connect"}
+        await self._closed.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self._connected.set()
+        elif message["type"] == "websocket.send":
+            self.frames.append((time.perf_counter(), json.loads(message["text"])))
+
+
+def percentiles(samples, scale: float = 1000.0, digits: int = 2) -> dict:
+    """p50/p95/p99/max of `samples` (seconds), in milliseconds by default."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * scale, digits)
+
+    return {"count": len(ordered), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(ordered[-1] * scale, digits)}
@@ -0,0 +1,232 @@
+"""Load test for the live-auction hot path, written as JSON so runs from two
+versions can be compared:
+
+- bid delivery: add_bidder -> /ws frame latency across N simulated displays
+- per sale size: Sale Program and Buyer List upload throughput, next_lot
+  latency, and cold/cached export throughput
+- FairEntry sync duration: initial sync, an unchanged re-sync, and a re-sync
+  with a tenth of the exhibitors edited upstream
+
+Runs the app in-process (httpx ASGI transport, displays attached straight to
+the /ws ASGI endpoint) against a scratch DB and a fake FairEntry client, so
+the numbers are the backend's own and not the network's.
+
+    cd backend && python benchmarks/hot_path.py [--displays N] [--bids N] [--sizes 1000,5000,20000] [--output results.json]
+    cd backend && python benchmarks/hot_path.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import harness
+from harness import AUTH_HEADERS, Display, checked, percentiles
+
+import database
+from ws_manager import WS_COALESCE_WINDOW_MS, WS_DELTA_FRAMES
+
+BID_LOTS = 200
+BIDS_PER_LOT = 25
+NEXT_LOT_STEPS = 200
+
+
+def _bidder_identifiers(frame: dict) -> set:
+    if frame.get("type") == "bidder_added":
+        return {frame["bidder"]["Identifier"]}
+    if frame.get("type") == "bid_update":
+        return {bidder["Identifier"] for bidder in frame["bidders"]}
+    return set()
+
+
+async def bid_delivery(client, displays: int, bids: int) -> dict:
+    """Time from posting a bid until each display has a frame showing it.
+    Bids are paced just past the coalescing window, as a clerk entering them
+    by hand would, so each one gets its own frame."""
+    await checked(client.post("/api/upload/sale_program", headers=AUTH_HEADERS,
+                              files={"file": ("sale.xlsx", harness.xlsx_bytes(harness.sale_sheet(BID_LOTS)))}))
+    await checked(client.post("/api/upload/buyer_list", headers=AUTH_HEADERS,
+                              files={"file": ("buyers.xlsx", harness.xlsx_bytes(harness.buyer_sheet(bids)))}))
+    screens = [Display() for _ in range(displays)]
+    for screen in screens:
+        await screen.connect()
+
+    pace = WS_COALESCE_WINDOW_MS / 1000 + 0.01
+    posted_at, post_seconds = {}, []
+    for i in range(bids):
+        if i and i % BIDS_PER_LOT == 0:
+            await checked(client.post("/api/lot/next", headers=AUTH_HEADERS))
+        identifier = i + 1
+        posted_at[identifier] = time.perf_counter()
+        await checked(client.post(f"/api/bidder/add/{identifier}", headers=AUTH_HEADERS))
+        post_seconds.append(time.perf_counter() - posted_at[identifier])
+        await asyncio.sleep(pace)
+    await asyncio.sleep(0.2)
+    for screen in screens:
+        await screen.close()
+
+    latencies, missed = [], 0
+    for screen in screens:
+        seen = {}
+        for received_at, frame in screen.frames:
+            for identifier in _bidder_identifiers(frame):
+                seen.setdefault(identifier, received_at)
+        for identifier, sent in posted_at.items():
+            if identifier in seen:
+                latencies.append(seen[identifier] - sent)
+            else:
+                missed += 1
+    return {
+        "displays": displays,
+        "bids": bids,
+        "post_ms": percentiles(post_seconds),
+        "delivery_ms": percentiles(latencies),
+        "missed_frames": missed,
+    }
+
+
+async def sale_size(client, lots: int) -> dict:
+    """Upload, navigation and export costs for a sale of `lots` lots."""
+    sale = harness.xlsx_bytes(harness.sale_sheet(lots))
+    buyers = harness.xlsx_bytes(harness.buyer_sheet(lots))
+    start = time.perf_counter()
+    await checked(client.post("/api/upload/sale_program", headers=AUTH_HEADERS, files={"file": ("sale.xlsx", sale)}))
+    sale_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    await checked(client.post("/api/upload/buyer_list", headers=AUTH_HEADERS, files={"file": ("buyers.xlsx", buyers)}))
+    buyer_seconds = time.perf_counter() - start
+
+    # One display attached so each move pays for its broadcast too.
+    screen = Display()
+    await screen.connect()
+    steps = []
+    for _ in range(min(NEXT_LOT_STEPS, lots - 1)):
+        start = time.perf_counter()
+        await checked(client.post("/api/lot/next", headers=AUTH_HEADERS))
+        steps.append(time.perf_counter() - start)
+    await screen.close()
+
+    exports = {}
+    for fmt in ("xlsx", "csv"):
+        start = time.perf_counter()
+        await checked(client.get(f"/api/export/bidders?format={fmt}", headers=AUTH_HEADERS))
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        await checked(client.get(f"/api/export/bidders?format={fmt}", headers=AUTH_HEADERS))
+        cached = time.perf_counter() - start
+        exports[fmt] = {
+            "cold_seconds": round(cold, 3),
+            "cold_rows_per_second": round(lots / cold),
+            "cached_ms": round(cached * 1000, 2),
+        }
+
+    return {
+        "sale_upload_seconds": round(sale_seconds, 3),
+        "sale_upload_rows_per_second": round(lots / sale_seconds),
+        "buyer_upload_seconds": round(buyer_seconds, 3),
+        "buyer_upload_rows_per_second": round(lots / buyer_seconds),
+        "next_lot_ms": percentiles(steps),
+        "export": exports,
+    }
+
+
+async def fairentry_sync(client, lots: int) -> dict:
+    """Wall time of the FairEntry syncs, upstream calls being free."""
+    harness.FakeFairEntryClient.lots = lots
+    harness.FakeFairEntryClient.buyers = lots
+    harness.FakeFairEntryClient.renamed_every = 0
+    await checked(client.post("/api/fairentry/connection", headers=AUTH_HEADERS,
+                              json={"username": "bench", "password": "bench", "fair_title": "Bench Fair"}))
+    await checked(client.post("/api/fairentry/sale-orders/select", headers=AUTH_HEADERS, json={"sale_order_id": 1}))
+
+    async def timed(target):
+        start = time.perf_counter()
+        await checked(client.post(f"/api/fairentry/sync/{target}/now", headers=AUTH_HEADERS))
+        return round(time.perf_counter() - start, 3)
+
+    results = {
+        "lots": lots,
+        "sale_initial_seconds": await timed("sale"),
+        "sale_unchanged_seconds": await timed("sale"),
+    }
+    harness.FakeFairEntryClient.renamed_every = 10
+    results["sale_tenth_edited_seconds"] = await timed("sale")
+    results["buyers_full_seconds"] = await timed("buyers")
+    results["buyers_unchanged_seconds"] = await timed("buyers")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(displays: int = 50, bids: int = 200, sizes=(1000, 5000, 20_000)) -> dict:
+    results = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite_profile": database.SQLITE_PROFILE,
+            "ws_coalesce_window_ms": WS_COALESCE_WINDOW_MS,
+            "ws_delta_frames": WS_DELTA_FRAMES,
+        },
+    }
+    async with harness.client() as client:
+        results["bid_delivery"] = await bid_delivery(client, displays, bids)
+        # Sizes go smallest first: each upload is a superset of the last, so
+        # every run ends with exactly `lots` lots.
+        results["sale_size"] = {str(lots): await sale_size(client, lots) for lots in sorted(sizes)}
+        results["fairentry_sync"] = await fairentry_sync(client, max(sizes))
+    return results
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix[:-1], value
+
+
+def compare(before_path: str, after_path: str):
+    """Print every metric the two result files share, with the change."""
+    with open(before_path) as f:
+        before = dict(_flatten({k: v for k, v in json.load(f).items() if k != "meta"}))
+    with open(after_path) as f:
+        after = dict(_flatten({k: v for k, v in json.load(f).items() if k != "meta"}))
+    width = max(len(key) for key in before)
+    for key, old in before.items():
+        if key not in after:
+            continue
+        new = after[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else ""
+        print(f"{key:<{width}}  {old:>12}  {new:>12}  {change:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--displays", type=int, default=50)
+    parser.add_argument("--bids", type=int, default=200)
+    parser.add_argument("--sizes", default="1000,5000,20000", help="comma-separated sale sizes, in lots")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    output = json.dumps(asyncio.run(run(args.displays, args.bids, sizes)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
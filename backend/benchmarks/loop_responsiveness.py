@@ -0,0 +1,96 @@
+"""Event-loop responsiveness while the backend does heavy work: the longest
+stall of a 5ms heartbeat task - the worst delay any /ws frame could have
+seen - during a large Sale Program upload, a FairEntry sale sync, a burst
+of logins and a burst of password guesses. Runs the app in-process over
+httpx's ASGI transport, with a fake FairEntry client.
+
+    cd backend && python benchmarks/loop_responsiveness.py [lots] [logins]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import harness
+from harness import AUTH_HEADERS, checked
+
+HEARTBEAT_SECONDS = 0.005
+
+
+async def _heartbeat(gaps: list, stop: asyncio.Event):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        now = time.perf_counter()
+        gaps.append(now - last - HEARTBEAT_SECONDS)
+        last = now
+
+
+async def _measure(label: str, work) -> dict:
+    gaps, stop = [], asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(gaps, stop))
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await heartbeat
+    stalls_ms = sorted(gap * 1000 for gap in gaps) or [0.0]
+    return {
+        "scenario": label,
+        "seconds": round(elapsed, 3),
+        "max_stall_ms": round(stalls_ms[-1], 1),
+        "p99_stall_ms": round(stalls_ms[int(len(stalls_ms) * 0.99)], 1),
+        "median_stall_ms": round(statistics.median(stalls_ms), 2),
+    }
+
+
+async def run(lots: int = 20_000, logins: int = 16) -> list:
+    harness.FakeFairEntryClient.lots = lots
+    sheet = harness.xlsx_bytes(harness.sale_sheet(lots))
+
+    async with harness.client() as client:
+        async def idle():
+            await asyncio.sleep(0.5)
+
+        async def upload():
+            await checked(client.post("/api/upload/sale_program", headers=AUTH_HEADERS,
+                                      files={"file": ("sale.xlsx", sheet)}))
+
+        async def sale_sync():
+            await checked(client.post("/api/fairentry/sale-orders/select", headers=AUTH_HEADERS,
+                                      json={"sale_order_id": 1}))
+            await checked(client.post("/api/fairentry/sync/sale/now", headers=AUTH_HEADERS))
+
+        async def login_burst():
+            responses = await asyncio.gather(*(
+                client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+                for _ in range(logins)
+            ))
+            for response in responses:
+                response.raise_for_status()
+
+        async def guessing_burst():
+            # Runs last: once throttled, this address can't log in for a while.
+            responses = await asyncio.gather(*(
+                client.post("/api/auth/login", json={"username": "admin", "password": f"guess{i}"})
+                for i in range(logins)
+            ))
+            statuses = {response.status_code for response in responses}
+            if not statuses <= {401, 429, 503}:
+                raise RuntimeError(f"Unexpected login responses: {statuses}")
+
+        await checked(client.post("/api/fairentry/connection", headers=AUTH_HEADERS,
+                                  json={"username": "bench", "password": "bench", "fair_title": "Bench Fair"}))
+        return [
+            await _measure("idle", idle),
+            await _measure(f"upload {lots} lots", upload),
+            await _measure(f"sale sync {lots} lots", sale_sync),
+            await _measure(f"{logins} concurrent logins", login_burst),
+            await _measure(f"{logins} concurrent password guesses", guessing_burst),
+        ]
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    print(json.dumps(asyncio.run(run(*args)), indent=2))
@@ -0,0 +1,99 @@
+"""Bid commits per second, and read latency while a sale-sync-sized write is
+in flight, under SQLITE_PROFILE=default and SQLITE_PROFILE=tuned. Each
+profile runs in its own subprocess against a fresh scratch DB on disk, since
+database.py configures its engine at import time.
+
+    cd backend && python benchmarks/sqlite_profile.py [bids] [lots]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROFILES = ("default", "tuned")
+
+
+def _worker(bids: int, lots: int) -> dict:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from sqlalchemy import func
+
+    from database import BidderLot, Buyer, SaleProgram, SessionLocal, init_database
+
+    init_database()
+    db = SessionLocal()
+    db.add_all(SaleProgram(lot_number=str(i), student_name=f"Exhibitor {i}", department="Beef", sort_order=i)
+               for i in range(lots))
+    db.add(Buyer(identifier=1, name="Bench Buyer"))
+    db.commit()
+    buyer_id = db.query(Buyer.id).scalar()
+    lot_ids = [row.id for row in db.query(SaleProgram.id).order_by(SaleProgram.id)]
+
+    # The add_bidder write path: one small insert and one commit per bid.
+    start = time.perf_counter()
+    for i in range(bids):
+        db.add(BidderLot(lot_id=lot_ids[i % lots], buyer_id=buyer_id, lot_index=i % lots))
+        db.commit()
+    bid_seconds = time.perf_counter() - start
+
+    # A reader polling lot counts while another connection rewrites every
+    # lot in one transaction, as a FairEntry sale sync does.
+    read_latencies = []
+    writing = threading.Event()
+    done = threading.Event()
+
+    def reader():
+        reader_db = SessionLocal()
+        writing.wait()
+        while not done.is_set():
+            read_start = time.perf_counter()
+            reader_db.query(func.count(SaleProgram.id)).scalar()
+            reader_db.rollback()
+            read_latencies.append(time.perf_counter() - read_start)
+        reader_db.close()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    write_start = time.perf_counter()
+    writing.set()
+    db.query(BidderLot).delete(synchronize_session=False)
+    db.query(SaleProgram).delete(synchronize_session=False)
+    db.add_all(SaleProgram(lot_number=str(i), student_name=f"Exhibitor {i}", department="Swine", sort_order=i)
+               for i in range(lots))
+    db.commit()
+    write_seconds = time.perf_counter() - write_start
+    done.set()
+    thread.join()
+    db.close()
+
+    read_latencies.sort()
+    return {
+        "bids": bids,
+        "bid_commits_per_second": round(bids / bid_seconds),
+        "sync_write_seconds": round(write_seconds, 3),
+        "reads_during_sync_write": len(read_latencies),
+        "max_read_ms": round(read_latencies[-1] * 1000, 2) if read_latencies else None,
+    }
+
+
+def run(bids: int = 2000, lots: int = 20_000) -> dict:
+    results = {}
+    for profile in PROFILES:
+        scratch_dir = tempfile.mkdtemp(prefix="auction-bench-")
+        env = dict(os.environ, SQLITE_PROFILE=profile, DATABASE_URL=f"sqlite:///{scratch_dir}/bench.db")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(bids), str(lots)],
+            env=env, cwd=scratch_dir, capture_output=True, text=True, check=True,
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        print(json.dumps(_worker(int(sys.argv[2]), int(sys.argv[3]))))
+    else:
+        args = [int(arg) for arg in sys.argv[1:]]
+        print(json.dumps(run(*args), indent=2))
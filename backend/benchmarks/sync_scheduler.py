@@ -0,0 +1,46 @@
+"""Checks the FairEntry auto-sync scheduler doesn't spin: with auto-sync on
+but no credentials configured, every run is skipped, and the scheduler must
+back off between them rather than loop straight back into another. Counts
+the runs of one scheduler over a few seconds - anything above one means it
+retried without waiting.
+
+    cd backend && python benchmarks/sync_scheduler.py [seconds]
+"""
+import asyncio
+import json
+import sys
+
+import harness
+from harness import AUTH_HEADERS, checked
+
+import fairentry_sync
+
+
+async def run(seconds: float = 2.0) -> dict:
+    async with harness.client() as client:
+        await checked(client.post("/api/fairentry/sync/buyers/toggle", headers=AUTH_HEADERS, json={"enabled": True}))
+
+    results = []
+
+    async def counting_buyer_sync(db):
+        result = await fairentry_sync.perform_buyer_sync(db)
+        results.append(result["status"])
+        return result
+
+    scheduler = asyncio.create_task(fairentry_sync._sync_scheduler("buyers", counting_buyer_sync))
+    await asyncio.sleep(seconds)
+    scheduler.cancel()
+    try:
+        await scheduler
+    except asyncio.CancelledError:
+        pass
+
+    report = {"seconds": seconds, "runs": len(results), "statuses": sorted(set(results))}
+    if results != ["skipped"]:
+        raise SystemExit(f"Expected exactly one skipped run, got: {json.dumps(report)}")
+    return report
+
+
+if __name__ == "__main__":
+    args = [float(arg) for arg in sys.argv[1:]]
+    print(json.dumps(asyncio.run(run(*args)), indent=2))
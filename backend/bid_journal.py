@@ -0,0 +1,213 @@
+"""Write-behind journal for bids. add_bidder acknowledges a bid as soon as it
+is appended here and applied to LiveState; a flush on the DB writer thread
+moves the journaled bids into bidders_per_lot in one transaction shortly
+after, so a burst of bids costs one commit instead of one each.
+
+The journal is an append-only file of JSON lines beside the SQLite file.
+Entries carry increasing ids, and each flush stores the highest id it wrote
+in auction_sessions.bid_journal_applied_id in the same transaction, so at
+startup open() replays exactly the entries a crash left behind. The file is
+truncated whenever everything in it has reached the DB.
+
+An append is one write() into the OS page cache, which survives the backend
+process dying. BID_JOURNAL_FSYNC also fsyncs every append, to survive power
+loss as well, at the cost of a disk flush per bid."""
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from database import (
+    BidderLot, Buyer, SaleProgram, SessionLocal, engine, get_or_create_session, mark_lots_changed, run_db,
+    set_pending_writes,
+)
+
+logger = logging.getLogger("adbackend")
+
+BID_JOURNAL_FSYNC = os.getenv("BID_JOURNAL_FSYNC", "").lower() in ("1", "true", "yes")
+# The first bid of a burst waits this long for its flush, so the rest of the
+# burst lands in the same transaction.
+BID_JOURNAL_FLUSH_MS = int(os.getenv("BID_JOURNAL_FLUSH_MS", "20"))
+FLUSH_RETRY_SECONDS = 1.0
+# Keeps IN (...) lists under SQLite's bound-parameter limit during a replay.
+_IN_CHUNK_SIZE = 500
+
+
+def _default_path() -> str:
+    # Next to the DB file, like SQLite's own -wal file, so a journal can
+    # only ever be replayed into the database it belongs to.
+    database = engine.url.database
+    if engine.url.get_backend_name() == "sqlite" and database and database != ":memory:":
+        return f"{database}-bids"
+    return os.path.join("data", "bid_journal")
+
+
+BID_JOURNAL_PATH = os.getenv("BID_JOURNAL_PATH") or _default_path()
+
+
+def _chunks(values: list):
+    for start in range(0, len(values), _IN_CHUNK_SIZE):
+        yield values[start:start + _IN_CHUNK_SIZE]
+
+
+def _apply_entries(db, entries: list):
+    """Insert the bids in `entries` that aren't in the DB yet - creating
+    buyers for unknown identifiers - and advance the applied watermark.
+    Idempotent, so a replay can't double up a bid. Doesn't commit."""
+    session = get_or_create_session(db)
+    applied_id = session.bid_journal_applied_id or 0
+    entries = [entry for entry in entries if entry["id"] > applied_id]
+    if not entries:
+        return
+
+    identifiers = sorted({entry["identifier"] for entry in entries})
+    buyer_ids = {}
+    for chunk in _chunks(identifiers):
+        buyer_ids.update(db.execute(select(Buyer.identifier, Buyer.id).where(Buyer.identifier.in_(chunk))).all())
+    new_buyers = {}
+    for entry in entries:
+        if entry["identifier"] not in buyer_ids:
+            new_buyers.setdefault(entry["identifier"], entry["name"])
+    if new_buyers:
+        db.execute(insert(Buyer), [{"identifier": identifier, "name": name} for identifier, name in new_buyers.items()])
+        for chunk in _chunks(sorted(new_buyers)):
+            buyer_ids.update(db.execute(select(Buyer.identifier, Buyer.id).where(Buyer.identifier.in_(chunk))).all())
+
+    lot_ids = sorted({entry["lot_id"] for entry in entries})
+    existing_lots, existing_bids = set(), set()
+    for chunk in _chunks(lot_ids):
+        existing_lots.update(db.scalars(select(SaleProgram.id).where(SaleProgram.id.in_(chunk))))
+        existing_bids.update(db.execute(select(BidderLot.lot_id, BidderLot.buyer_id).where(BidderLot.lot_id.in_(chunk))).all())
+
+    rows = []
+    for entry in entries:
+        if entry["lot_id"] not in existing_lots:
+            logger.warning(f"Dropping journaled bid {entry['id']} for bidder {entry['identifier']}: lot no longer exists")
+            continue
+        key = (entry["lot_id"], buyer_ids[entry["identifier"]])
+        if key in existing_bids:
+            continue
+        existing_bids.add(key)
+        rows.append({
+            "lot_id": entry["lot_id"],
+            "buyer_id": key[1],
+            "lot_index": entry["lot_index"],
+            # When the bid was taken, not when it was flushed - undo picks
+            # the most recent bid by created_at.
+            "created_at": datetime.fromisoformat(entry["at"]),
+        })
+    if rows:
+        db.execute(insert(BidderLot), rows)
+        mark_lots_changed(db, [row["lot_id"] for row in rows])
+    session.bid_journal_applied_id = entries[-1]["id"]
+
+
+def _read_entries(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Most likely the tail of an append cut short by the crash.
+                logger.warning(f"Skipping unreadable line {line_number} of bid journal {path}")
+    return entries
+
+
+class BidJournal:
+    """The journal file plus the entries in it not yet flushed to the DB.
+    append() runs on the event loop, flush() on the DB writer thread."""
+
+    def __init__(self):
+        self.fd = None
+        self.next_id = 1
+        self.pending = []
+        self.lock = threading.Lock()
+        self._flush_task = None
+
+    def open(self, path: str = BID_JOURNAL_PATH):
+        """Replay whatever a previous run left in the journal at `path`, then
+        start it afresh. Call once at startup, after init_database(); raises
+        (leaving the file alone) if the replay can't be written."""
+        entries = _read_entries(path)
+        db = SessionLocal()
+        try:
+            applied_id = get_or_create_session(db).bid_journal_applied_id or 0
+            replay = [entry for entry in entries if entry["id"] > applied_id]
+            if replay:
+                _apply_entries(db, replay)
+                db.commit()
+                logger.warning(f"Replayed {len(replay)} bid(s) from {path} that hadn't reached the database")
+        finally:
+            db.close()
+
+        self.next_id = max([applied_id] + [entry["id"] for entry in entries]) + 1
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+        set_pending_writes(self)
+
+    def has_pending(self) -> bool:
+        return bool(self.pending)
+
+    def pending_entries(self) -> list:
+        with self.lock:
+            return list(self.pending)
+
+    def append(self, lot_id: int, lot_index: int, identifier: int, name: str) -> dict:
+        """Durably record a bid and schedule its flush. Must be called on the
+        event loop."""
+        with self.lock:
+            entry = {
+                "id": self.next_id,
+                "lot_id": lot_id,
+                "lot_index": lot_index,
+                "identifier": identifier,
+                "name": name,
+                "at": datetime.utcnow().isoformat(),
+            }
+            os.write(self.fd, (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8"))
+            if BID_JOURNAL_FSYNC:
+                os.fsync(self.fd)
+            self.next_id += 1
+            self.pending.append(entry)
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_after(BID_JOURNAL_FLUSH_MS / 1000))
+        return entry
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        try:
+            await run_db(self.flush, write=True)
+        except Exception:
+            # The entries stay pending (and in the file) - try again shortly.
+            logger.exception("Bid journal flush failed")
+            if self._flush_task is None:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_after(FLUSH_RETRY_SECONDS))
+
+    def flush(self):
+        """Write every pending entry to the DB in one transaction. Writer
+        thread only - run_db() calls it ahead of every other DB job."""
+        with self.lock:
+            batch = list(self.pending)
+        if not batch:
+            return
+        db = SessionLocal()
+        try:
+            _apply_entries(db, batch)
+            db.commit()
+        finally:
+            db.close()
+        with self.lock:
+            del self.pending[:len(batch)]
+            if not self.pending:
+                os.ftruncate(self.fd, 0)
+
+
+bid_journal = BidJournal()
@@ -0,0 +1,224 @@
+import codecs
+import csv
+import os
+import time
+from itertools import islice
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from sqlalchemy import insert, select, update
+
+from database import Buyer, SaleProgram, mark_buyer_lots_changed, mark_lots_changed, mark_lots_reset
+
+# Set-based import of the uploaded Sale Program / Buyer List sheets: each
+# sheet is normalized a column at a time, merged against the rows already in
+# the DB to split it into added/updated/unchanged, and written with one
+# executemany INSERT and one executemany UPDATE. Large sheets are read lazily
+# and upserted IMPORT_CHUNK_ROWS rows at a time, so memory stays flat however
+# big the file is. Everything here blocks - the upload endpoints run it in a
+# worker thread.
+
+SALE_PROGRAM_COLUMNS = {"Sale #": "LotNumber", "Exhibitor": "StudentName", "Department": "Department"}
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+# Minimum gap between progress reports for one upload.
+IMPORT_PROGRESS_INTERVAL_SECONDS = 2
+
+
+def _cell_text(value):
+    """A cell as the text the import stores. Whole-number floats lose the
+    ".0" - Excel keeps every number as a float, so lot 103 can come back as
+    103.0 - and blanks stay None."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _xlsx_rows(file):
+    # read_only streams the sheet XML out of the zip instead of building the
+    # whole workbook in memory.
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            # Text here, not in the DataFrame: pandas would infer each
+            # chunk's column types separately, so a numeric column would
+            # only turn float in chunks that happen to contain a blank.
+            yield tuple(_cell_text(value) for value in row)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(file):
+    reader = csv.reader(codecs.getreader("utf-8-sig")(file))
+    for row in reader:
+        # Blank CSV cells are "", where openpyxl/pandas would give None.
+        yield tuple(value if value != "" else None for value in row)
+
+
+def iter_sheet_chunks(file, filename: str, chunk_rows: int = IMPORT_CHUNK_ROWS):
+    """Yield an uploaded .xlsx or .csv sheet as DataFrames of at most
+    `chunk_rows` rows, headed by the sheet's first row. Fully blank rows
+    (formatting-only rows at the bottom of a sheet) are skipped."""
+    rows = _csv_rows(file) if filename.lower().endswith(".csv") else _xlsx_rows(file)
+    header = next(rows, None)
+    if header is None:
+        return
+    rows = (row for row in rows if any(value is not None for value in row))
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield pd.DataFrame(chunk, columns=header, dtype=object)
+
+
+def import_chunks(chunks, import_fn, progress=None) -> tuple[int, int]:
+    """Run `import_fn(df, start_row)` over every chunk, summing the
+    (added, updated) counts. `progress(rows_done)` is called at most every
+    IMPORT_PROGRESS_INTERVAL_SECONDS."""
+    added_total = updated_total = rows_done = 0
+    last_report = time.monotonic()
+    for df in chunks:
+        added, updated = import_fn(df, rows_done)
+        added_total += added
+        updated_total += updated
+        rows_done += len(df)
+        if progress and time.monotonic() - last_report >= IMPORT_PROGRESS_INTERVAL_SECONDS:
+            progress(rows_done)
+            last_report = time.monotonic()
+    return added_total, updated_total
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    # Same blank handling the old row-by-row import had, so re-uploading a
+    # sheet imported before this engine existed doesn't count as updates.
+    return df.replace({np.nan: None})
+
+
+def _text_column(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[column].map(str)
+
+
+def _changed(merged: pd.DataFrame, columns) -> pd.Series:
+    mask = pd.Series(False, index=merged.index)
+    for column in columns:
+        mask |= merged[column] != merged[f"{column}_old"]
+    return mask
+
+
+def import_sale_program(db, df: pd.DataFrame, sale_order_id, start_row: int = 0) -> tuple[int, int]:
+    """Upsert (a chunk of) a Sale Program sheet into the given Sale Order's
+    rows, keyed on lot number, with sort_order taken from the sheet's row
+    order - `start_row` is the chunk's offset into the sheet. Returns (added,
+    updated); a row only counts as updated if its exhibitor or department
+    changed. Flushes but doesn't commit."""
+    df = _normalize(df.rename(columns=SALE_PROGRAM_COLUMNS))
+    incoming = pd.DataFrame({
+        "lot_number": _text_column(df, "LotNumber"),
+        "student_name": _text_column(df, "StudentName"),
+        "department": _text_column(df, "Department"),
+        "sort_order": np.arange(start_row, start_row + len(df)),
+    })
+
+    existing = pd.DataFrame(
+        db.execute(
+            select(SaleProgram.id, SaleProgram.lot_number, SaleProgram.student_name,
+                   SaleProgram.department, SaleProgram.sort_order)
+            .where(
+                SaleProgram.sale_order_id == sale_order_id,
+                SaleProgram.lot_number.in_(incoming["lot_number"].unique().tolist()),
+            )
+        ).all(),
+        columns=["id", "lot_number", "student_name", "department", "sort_order"],
+    ).drop_duplicates("lot_number", keep="last")
+
+    merged = incoming.merge(existing, on="lot_number", how="left", suffixes=("", "_old"))
+    is_new = merged["id"].isna()
+    matched = merged[~is_new]
+    details_changed = _changed(matched, ["student_name", "department"])
+    reordered = matched["sort_order"] != matched["sort_order_old"]
+    needs_update = details_changed | reordered
+
+    new_rows = merged[is_new]
+    if len(new_rows):
+        db.execute(insert(SaleProgram), [
+            {
+                "lot_number": lot_number,
+                "student_name": student_name,
+                "department": department,
+                "sort_order": int(sort_order),
+                "sale_order_id": sale_order_id,
+            }
+            for lot_number, student_name, department, sort_order in zip(
+                new_rows["lot_number"], new_rows["student_name"],
+                new_rows["department"], new_rows["sort_order"],
+            )
+        ])
+
+    to_update = matched[needs_update]
+    if len(to_update):
+        db.execute(update(SaleProgram), [
+            {"id": int(lot_id), "student_name": student_name, "department": department, "sort_order": int(sort_order)}
+            for lot_id, student_name, department, sort_order in zip(
+                to_update["id"], to_update["student_name"],
+                to_update["department"], to_update["sort_order"],
+            )
+        ])
+
+    if len(new_rows) or reordered.any():
+        mark_lots_reset(db)
+    else:
+        mark_lots_changed(db, matched.loc[details_changed, "id"].astype("int64").tolist())
+
+    db.flush()
+    return len(new_rows), int(details_changed.sum())
+
+
+def import_buyer_list(db, df: pd.DataFrame, start_row: int = 0) -> tuple[int, int]:
+    """Upsert (a chunk of) a Buyer List sheet keyed on identifier (a blank
+    identifier is 0). Returns (added, updated); if an identifier appears
+    twice, the last row wins. Flushes but doesn't commit."""
+    df = _normalize(df)
+    if "Identifier" in df.columns:
+        identifiers = pd.to_numeric(df["Identifier"]).fillna(0).astype("int64")
+    else:
+        identifiers = pd.Series(0, index=df.index, dtype="int64")
+    incoming = pd.DataFrame({
+        "identifier": identifiers,
+        "name": _text_column(df, "Name"),
+    }).drop_duplicates("identifier", keep="last")
+
+    existing = pd.DataFrame(
+        db.execute(
+            select(Buyer.id, Buyer.identifier, Buyer.name)
+            .where(Buyer.identifier.in_(incoming["identifier"].tolist()))
+        ).all(),
+        columns=["id", "identifier", "name"],
+    ).dropna(subset=["identifier"])
+    existing["identifier"] = existing["identifier"].astype("int64")
+
+    merged = incoming.merge(existing, on="identifier", how="left", suffixes=("", "_old"))
+    is_new = merged["id"].isna()
+    matched = merged[~is_new]
+    to_update = matched[_changed(matched, ["name"])]
+
+    new_rows = merged[is_new]
+    if len(new_rows):
+        db.execute(insert(Buyer), [
+            {"identifier": int(identifier), "name": name}
+            for identifier, name in zip(new_rows["identifier"], new_rows["name"])
+        ])
+
+    if len(to_update):
+        db.execute(update(Buyer), [
+            {"id": int(buyer_id), "name": name}
+            for buyer_id, name in zip(to_update["id"], to_update["name"])
+        ])
+        mark_buyer_lots_changed(db, to_update["id"].astype("int64").tolist())
+
+    db.flush()
+    return len(new_rows), len(to_update)
@@ -0,0 +1,92 @@
+"""In-memory buyer lookup behind bidder-entry autocomplete, so the console
+can confirm who a number belongs to as it's typed - before a mistyped one
+becomes a placeholder buyer - without downloading the buyer table.
+
+Everything is a bisect into a sorted array:
+
+- bidder numbers are kept as sorted ints. The numbers starting with "12"
+  are exactly those in [12, 13), [120, 130), [1200, 1300)..., so a prefix
+  search walks those ranges shortest first and comes back in numeric order;
+- every word of every name is kept as a sorted (word, identifier) array, so
+  a name fragment is a prefix range on it. Further words in the query must
+  each start some word of the same name.
+
+LiveState owns the index: it's rebuilt with the buyer list on every
+reload() (uploads, syncs, merges) and add() covers the placeholders new
+bids create in between."""
+import re
+from bisect import bisect_left, insort
+
+MAX_SEARCH_RESULTS = 50
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(name) -> list:
+    return _WORD.findall((name or "").casefold())
+
+
+class BuyerIndex:
+    """Not thread-safe on its own - LiveState only touches it under its lock."""
+
+    def __init__(self, buyers: dict):
+        self.names = dict(buyers)
+        self.numbers = sorted(self.names)
+        self.words = sorted({(word, identifier) for identifier, name in self.names.items() for word in _words(name)})
+
+    def add(self, identifier: int, name: str):
+        if identifier in self.names:
+            return
+        self.names[identifier] = name
+        insort(self.numbers, identifier)
+        for word in set(_words(name)):
+            insort(self.words, (word, identifier))
+
+    def _by_number(self, prefix: str, limit: int) -> list:
+        if prefix != "0" and prefix.startswith("0"):
+            return []
+        low, high = int(prefix), int(prefix) + 1
+        found = []
+        while len(found) < limit and self.numbers and low <= self.numbers[-1]:
+            start = bisect_left(self.numbers, low)
+            end = min(bisect_left(self.numbers, high), start + limit - len(found))
+            found.extend(self.numbers[start:end])
+            if low == 0:
+                # Nothing else starts with a 0.
+                break
+            low, high = low * 10, high * 10
+        return found
+
+    def _by_name(self, query: str, limit: int) -> list:
+        first, *rest = _words(query)
+        found, seen = [], set()
+        index = bisect_left(self.words, (first,))
+        while index < len(self.words) and len(found) < limit:
+            word, identifier = self.words[index]
+            if not word.startswith(first):
+                break
+            index += 1
+            if identifier in seen:
+                continue
+            seen.add(identifier)
+            name_words = _words(self.names[identifier])
+            if all(any(name_word.startswith(part) for name_word in name_words) for part in rest):
+                found.append(identifier)
+        return found
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Buyers whose number starts with `query` (an exact match first), or
+        whose name has words starting with each word of it, as
+        {Identifier, Name} dicts."""
+        query = query.strip()
+        if not query or limit < 1:
+            return []
+        # isdigit() alone also accepts digits like "²" that int() rejects;
+        # those can't be bidder numbers, so they go to the name search.
+        if query.isascii() and query.isdigit():
+            found = self._by_number(query, limit)
+        elif _words(query):
+            found = self._by_name(query, limit)
+        else:
+            found = []
+        return [{"Identifier": identifier, "Name": self.names[identifier]} for identifier in found]
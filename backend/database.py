@@ -1,7 +1,12 @@
+import asyncio
+import contextvars
+import functools
+import itertools
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, Boolean, text
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, create_engine, Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index, text, func, tuple_, delete, insert, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, joinedload
 from datetime import datetime
 import os
 
@@ -12,10 +17,83 @@ ALLOWED_THEMES = {"classic", "fourh_green", "fourh_green_solid", "high_contrast"
 DEFAULT_THEME = "classic"
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/auction.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# Threads serving reads for the API - see run_db(). Writes get one more.
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+# "tuned" applies SQLITE_PRAGMAS to every connection; "default" leaves
+# SQLite's stock settings (rollback journal, fsync on every commit).
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_PRAGMAS = {
+    # Readers no longer block behind a writer (or a writer behind readers),
+    # and a commit is an append to the WAL rather than a journal rewrite.
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # In WAL mode NORMAL only fsyncs at checkpoints: a power cut can lose the
+    # last few commits, but never corrupts the database.
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative means KiB: 64 MiB of page cache per connection.
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+}
+
+if "sqlite" in DATABASE_URL:
+    # One pooled connection per DB executor thread, plus headroom for the
+    # logins and dependency teardown that run on the default thread pool.
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=DB_READ_WORKERS + 1,
+        max_overflow=10,
+    )
+
+    if SQLITE_PROFILE == "tuned":
+        @event.listens_for(engine, "connect")
+        def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+else:
+    engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Table name -> a number that changes after every committed write to that
+# table (through a session), so caches can key on it. Process-local: it
+# starts empty on every boot, so never persist anything keyed on it.
+table_versions = {}
+_version_counter = itertools.count(1)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _note_flushed_tables(session, flush_context):
+    written = session.info.setdefault("written_tables", set())
+    for instance in itertools.chain(session.new, session.dirty, session.deleted):
+        written.add(instance.__table__.name)
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _note_bulk_statement_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        orm_execute_state.session.info.setdefault("written_tables", set()).add(table.name)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_table_versions(session):
+    # Bumped only once the write is visible to other connections - bumping
+    # at flush time would let a reader cache pre-commit data under the new
+    # version.
+    for table in session.info.pop("written_tables", ()):
+        table_versions[table] = next(_version_counter)
+    _note_committed_change_version(session.info.pop("change_version", None))
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rolled_back_tables(session):
+    session.info.pop("written_tables", None)
+    session.info.pop("change_version", None)
+
+def data_version(*tables):
+    """A hashable snapshot of the given tables' write versions."""
+    return tuple(table_versions.get(table, 0) for table in tables)
+
 class SaleProgram(Base):
     __tablename__ = "sale_programs"
 
@@ -39,7 +117,11 @@ class SaleProgram(Base):
     sale_order_id = Column(Integer, index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    bidders = relationship("BidderLot", back_populates="lot")
+    bidders = relationship("BidderLot", back_populates="lot", order_by="BidderLot.id")
+
+    # Matches ordered_lots() exactly, so walking a Sale Order in lot order
+    # (or counting the lots ahead of one) is an index range scan, not a sort.
+    __table_args__ = (Index("ix_sale_programs_order", "sale_order_id", "sort_order", "id"),)
 
 class Buyer(Base):
     __tablename__ = "buyers"
@@ -56,10 +138,22 @@ class AuctionSession(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     current_lot_index = Column(Integer, default=-1)
+    # The SaleProgram row at current_lot_index, NULL while nothing has been
+    # selected yet (index -1). Lets the current lot be found - and followed
+    # to its new position when the lot list changes - by primary key.
+    current_lot_id = Column(Integer, nullable=True)
     theme = Column(String, default=DEFAULT_THEME)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Highest bid journal entry already written to bidders_per_lot, so a
+    # replay after a crash skips the ones that made it (see bid_journal.py).
+    bid_journal_applied_id = Column(Integer, default=0)
+    # The review change feed's counter - the last version handed out - and
+    # the last version at which the lot list itself changed (see
+    # mark_lots_reset).
+    change_version = Column(Integer, default=0)
+    review_reset_version = Column(Integer, default=0)
 
 class FairEntryConnection(Base):
     """Shared FairEntry login, used by every sync target."""
@@ -88,6 +182,10 @@ class FairEntrySyncStatus(Base):
     consecutive_failures = Column(Integer, default=0)
     selected_sale_order_id = Column(Integer, nullable=True)
     selected_sale_order_name = Column(String, nullable=True)
+    # Hash of the last payload applied - a sync that fetches the same content
+    # again skips its DB phase. Cleared whenever the rows it wrote are changed
+    # by something else, so the next sync re-applies the payload.
+    payload_fingerprint = Column(String, nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class FairEntrySaleOrderOption(Base):
@@ -109,6 +207,15 @@ class User(Base):
     is_admin = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class LotChange(Base):
+    """The review change version (see mark_lots_changed) at which a lot's
+    details or bidders last changed. Kept out of sale_programs so stamping a
+    bid doesn't count as a write to the lot list itself (table_versions)."""
+    __tablename__ = "lot_changes"
+
+    lot_id = Column(Integer, ForeignKey("sale_programs.id"), primary_key=True)
+    change_version = Column(Integer, index=True)
+
 class BidderLot(Base):
     __tablename__ = "bidders_per_lot"
     
@@ -129,13 +236,60 @@ def get_db():
     finally:
         db.close()
 
+# The Session is synchronous, so the async endpoints hand all ORM work to one
+# of these instead of running it on the event loop, where any slow query would
+# stall every display's WebSocket. Reads share a small pool. Writes go through
+# a single thread: SQLite only ever has one writer anyway, and queueing them
+# here keeps bids, uploads and syncs strictly ordered instead of racing for
+# the lock - and makes the writer thread the one place LiveState is mutated.
+db_read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-read")
+db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+# Writes that were acknowledged before reaching the DB - the bid journal,
+# once bid_journal.open() has registered it. Drained on the writer
+# thread ahead of any other DB work, so nothing reads the DB or writes to it
+# around a bid the displays have already shown.
+_pending_writes = None
+
+def set_pending_writes(pending):
+    """Register an object with has_pending() and flush() - see _pending_writes."""
+    global _pending_writes
+    _pending_writes = pending
+
+def _drain_pending_writes():
+    if _pending_writes is not None:
+        _pending_writes.flush()
+
+def _after_pending_writes(fn, *args):
+    _drain_pending_writes()
+    return fn(*args)
+
+async def run_db(fn, *args, write=False):
+    """Run `fn(*args)` on the DB read pool, or on the single writer thread
+    with write=True, and await the result. A Session must only be used by
+    one call at a time - await each run_db() before the next. Runs in a copy
+    of the caller's context, so per-request state (metrics) follows it."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    if write:
+        return await loop.run_in_executor(db_write_executor, functools.partial(context.run, _after_pending_writes, fn, *args))
+    if _pending_writes is not None and _pending_writes.has_pending():
+        await loop.run_in_executor(db_write_executor, _drain_pending_writes)
+    return await loop.run_in_executor(db_read_executor, functools.partial(context.run, fn, *args))
+
 def init_database():
     """Initialize database tables"""
     os.makedirs("data", exist_ok=True)
     Base.metadata.create_all(bind=engine)
     _ensure_theme_column()
+    _ensure_current_lot_column()
     _ensure_sale_program_columns()
+    _ensure_sale_program_order_index()
+    _ensure_sync_status_fingerprint_column()
+    _ensure_bid_journal_column()
+    _ensure_change_version_columns()
     _ensure_default_admin()
+    _load_committed_change_version()
     logger.info("Database initialized")
 
 def _ensure_default_admin():
@@ -164,6 +318,57 @@ def _ensure_theme_column():
             conn.execute(text(f"ALTER TABLE auction_sessions ADD COLUMN theme VARCHAR DEFAULT '{DEFAULT_THEME}'"))
             conn.commit()
 
+def _ensure_current_lot_column():
+    """create_all() only creates missing tables, not missing columns on
+    existing ones, so add `current_lot_id` by hand for databases created
+    before it existed."""
+    with engine.connect() as conn:
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(auction_sessions)"))]
+        if "current_lot_id" not in columns:
+            conn.execute(text("ALTER TABLE auction_sessions ADD COLUMN current_lot_id INTEGER"))
+            conn.commit()
+
+def _ensure_sale_program_order_index():
+    """create_all() doesn't add new indexes to existing tables either."""
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_sale_programs_order "
+            "ON sale_programs (sale_order_id, sort_order, id)"
+        ))
+        conn.commit()
+
+def _ensure_sync_status_fingerprint_column():
+    """create_all() only creates missing tables, not missing columns on
+    existing ones, so add `payload_fingerprint` by hand for databases created
+    before it existed."""
+    with engine.connect() as conn:
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(fairentry_sync_status)"))]
+        if "payload_fingerprint" not in columns:
+            conn.execute(text("ALTER TABLE fairentry_sync_status ADD COLUMN payload_fingerprint VARCHAR"))
+            conn.commit()
+
+def _ensure_bid_journal_column():
+    """create_all() only creates missing tables, not missing columns on
+    existing ones, so add `bid_journal_applied_id` by hand for databases
+    created before it existed."""
+    with engine.connect() as conn:
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(auction_sessions)"))]
+        if "bid_journal_applied_id" not in columns:
+            conn.execute(text("ALTER TABLE auction_sessions ADD COLUMN bid_journal_applied_id INTEGER DEFAULT 0"))
+            conn.commit()
+
+def _ensure_change_version_columns():
+    """create_all() only creates missing tables, not missing columns on
+    existing ones, so add the review change feed's counters by hand for
+    databases created before they existed."""
+    with engine.connect() as conn:
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(auction_sessions)"))]
+        if "change_version" not in columns:
+            conn.execute(text("ALTER TABLE auction_sessions ADD COLUMN change_version INTEGER DEFAULT 0"))
+        if "review_reset_version" not in columns:
+            conn.execute(text("ALTER TABLE auction_sessions ADD COLUMN review_reset_version INTEGER DEFAULT 0"))
+        conn.commit()
+
 def _ensure_sale_program_columns():
     """create_all() only creates missing tables, not missing columns on
     existing ones, so add sort_order/fairentry_entry_id/sale_order_id by hand
@@ -196,6 +401,87 @@ def ordered_lots(db):
         .order_by(SaleProgram.sort_order, SaleProgram.id)
     )
 
+def lots_with_bidders(db):
+    """ordered_lots() with every lot's bids and each bid's buyer loaded in
+    the same query, for anything that walks the whole sale - the alternative
+    is a query per lot plus one per bid."""
+    return (
+        ordered_lots(db)
+        .options(joinedload(SaleProgram.bidders).joinedload(BidderLot.buyer))
+        .all()
+    )
+
+def lot_bidders(lot):
+    """The {Identifier, Name} list for a lot loaded by lots_with_bidders(),
+    in the order the bids were recorded. Bids whose buyer no longer exists
+    are left out."""
+    return [
+        {"Identifier": bid.buyer.identifier, "Name": bid.buyer.name}
+        for bid in lot.bidders if bid.buyer
+    ]
+
+# The review change feed. Every write that changes a lot's details or
+# bidders stamps the lot with the next version from one counter kept on the
+# AuctionSession row; GET /api/review/lots?since=N returns the lots stamped
+# after N. Versions are only handed out on the DB writer thread, inside the
+# write's own transaction, so they commit in order: a reader that sees
+# version N has every change up to N.
+_committed_change_version = 0
+_CHANGE_CHUNK_SIZE = 500
+
+def _load_committed_change_version():
+    global _committed_change_version
+    with engine.connect() as conn:
+        _committed_change_version = conn.execute(
+            select(func.max(AuctionSession.change_version)).where(AuctionSession.is_active == True)
+        ).scalar() or 0
+
+def _note_committed_change_version(version):
+    global _committed_change_version
+    if version is not None:
+        _committed_change_version = max(_committed_change_version, version)
+
+def review_version() -> int:
+    """The newest committed review change version, for WebSocket frames -
+    a reviewer already at (or past) it has nothing to fetch."""
+    return _committed_change_version
+
+def _next_change_version(db) -> int:
+    session = get_or_create_session(db)
+    session.change_version = (session.change_version or 0) + 1
+    db.info["change_version"] = session.change_version
+    return session.change_version
+
+def mark_lots_changed(db, lot_ids):
+    """Stamp these lots with a new review change version. Call from any
+    write to a lot's details or bidders that leaves the lot list as it is;
+    writer thread only, inside the write's transaction. Caller commits."""
+    lot_ids = sorted(set(lot_ids))
+    if not lot_ids:
+        return
+    version = _next_change_version(db)
+    for start in range(0, len(lot_ids), _CHANGE_CHUNK_SIZE):
+        chunk = lot_ids[start:start + _CHANGE_CHUNK_SIZE]
+        db.execute(delete(LotChange).where(LotChange.lot_id.in_(chunk)))
+        db.execute(insert(LotChange), [{"lot_id": lot_id, "change_version": version} for lot_id in chunk])
+
+def mark_buyer_lots_changed(db, buyer_ids):
+    """mark_lots_changed() for every lot these buyers bid on, after they're
+    renamed - each lot's bidder list shows the names. Caller commits."""
+    buyer_ids = sorted(set(buyer_ids))
+    lot_ids = set()
+    for start in range(0, len(buyer_ids), _CHANGE_CHUNK_SIZE):
+        lot_ids.update(db.scalars(
+            select(BidderLot.lot_id).where(BidderLot.buyer_id.in_(buyer_ids[start:start + _CHANGE_CHUNK_SIZE])).distinct()
+        ))
+    mark_lots_changed(db, lot_ids)
+
+def mark_lots_reset(db):
+    """Record a change the per-lot feed can't describe - lots added, removed
+    or reordered, or another Sale Order selected - so every reviewer behind
+    it reloads the whole sale. Writer thread only; caller commits."""
+    get_or_create_session(db).review_reset_version = _next_change_version(db)
+
 def get_or_create_session(db):
     """Get or create the current auction session"""
     session = db.query(AuctionSession).filter(AuctionSession.is_active == True).first()
@@ -212,6 +498,43 @@ def clamp_current_lot_index(session, lot_count: int):
     if session.current_lot_index >= lot_count:
         session.current_lot_index = lot_count - 1
 
+def lot_position(db, lot) -> int:
+    """`lot`'s index within ordered_lots() - a count over the
+    ix_sale_programs_order range ahead of it, rather than an OFFSET walk."""
+    return (
+        db.query(func.count(SaleProgram.id))
+        .filter(
+            SaleProgram.sale_order_id == lot.sale_order_id,
+            tuple_(SaleProgram.sort_order, SaleProgram.id) < (lot.sort_order, lot.id),
+        )
+        .scalar()
+    )
+
+def set_current_lot(session, index: int, lot_id):
+    """Move the session to the lot at `index` (None for index -1). Caller is
+    expected to commit."""
+    session.current_lot_index = index
+    session.current_lot_id = lot_id
+
+def realign_current_lot(db, session):
+    """After the lot list changes (manual Sale Program upload or a FairEntry
+    sale sync), stay on the same lot if it's still in the active Sale Order,
+    moving current_lot_index to wherever it now sits. Otherwise fall back to
+    clamping the old index. Caller is expected to commit."""
+    lot = None
+    if session.current_lot_id:
+        lot = db.query(SaleProgram).filter(SaleProgram.id == session.current_lot_id).first()
+    if lot and lot.sale_order_id == get_active_sale_order_id(db):
+        session.current_lot_index = lot_position(db, lot)
+        return
+
+    lots = ordered_lots(db)
+    clamp_current_lot_index(session, lots.count())
+    if session.current_lot_index < 0:
+        session.current_lot_id = None
+    else:
+        session.current_lot_id = lots.with_entities(SaleProgram.id).offset(session.current_lot_index).scalar()
+
 def get_or_create_fairentry_connection(db):
     """Get or create the singleton FairEntry connection (credentials) row"""
     connection = db.query(FairEntryConnection).first()
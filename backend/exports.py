@@ -0,0 +1,112 @@
+import csv
+import logging
+import os
+import tempfile
+import threading
+from itertools import groupby
+
+import xlsxwriter
+from sqlalchemy import select
+
+from database import (
+    BidderLot, Buyer, SaleProgram,
+    data_version, get_active_sale_order_id,
+)
+
+logger = logging.getLogger("adbackend")
+
+EXPORT_COLUMNS = ["LotNumber", "StudentName", "Department", "Buyers"]
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+}
+
+# Everything the export's contents depend on - fairentry_sync_status because
+# it holds the selected Sale Order, which decides which lots are exported.
+_EXPORT_TABLES = ("sale_programs", "bidders_per_lot", "buyers", "fairentry_sync_status")
+
+_cache_dir = None
+_cached_paths = {}
+_cache_lock = threading.Lock()
+
+
+def _export_rows(db):
+    """(LotNumber, StudentName, Department, Buyers) per lot of the active
+    Sale Order, in lot order, streamed from a single outer-joined cursor
+    rather than materialized - memory stays flat however big the sale is."""
+    result = db.execute(
+        select(SaleProgram.id, SaleProgram.lot_number, SaleProgram.student_name,
+               SaleProgram.department, Buyer.identifier)
+        .outerjoin(BidderLot, BidderLot.lot_id == SaleProgram.id)
+        .outerjoin(Buyer, Buyer.id == BidderLot.buyer_id)
+        .where(SaleProgram.sale_order_id == get_active_sale_order_id(db))
+        .order_by(SaleProgram.sort_order, SaleProgram.id, BidderLot.id)
+        .execution_options(yield_per=1000)
+    )
+    for (_, lot_number, student_name, department), rows in groupby(result, key=lambda row: tuple(row[:4])):
+        buyers = ", ".join(str(row.identifier) for row in rows if row.identifier is not None)
+        yield lot_number, student_name, department, buyers
+
+
+def _write_xlsx(db, path):
+    # constant_memory flushes each row to disk as soon as the next one starts.
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        worksheet = workbook.add_worksheet()
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+        worksheet.write_row(0, 0, EXPORT_COLUMNS, header_format)
+        for row_number, row in enumerate(_export_rows(db), start=1):
+            worksheet.write_row(row_number, 0, row)
+    finally:
+        workbook.close()
+
+
+def _write_csv(db, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        writer.writerows(_export_rows(db))
+
+
+_WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv}
+
+_STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def open_bidders_export(db, fmt: str):
+    """An up-to-date bidders export in `fmt` ('xlsx' or 'csv'), opened for
+    reading. Files are cached per format and reused until a lot, bid, buyer
+    or Sale Order selection changes. Blocking - run it in a worker thread.
+
+    The file is opened under the cache lock: a newer version can replace
+    (and unlink) it at any time after that, and only an already-open handle
+    keeps the contents readable until the response has sent them."""
+    global _cache_dir
+
+    # Read the version before the data: if a write lands mid-export, the file
+    # is filed under the older version and simply regenerated next time.
+    version = data_version(*_EXPORT_TABLES)
+    with _cache_lock:
+        cached = _cached_paths.get(fmt)
+        if cached and cached[0] == version and os.path.exists(cached[1]):
+            return open(cached[1], "rb")
+
+        if _cache_dir is None:
+            _cache_dir = tempfile.mkdtemp(prefix="auction-exports-")
+        path = os.path.join(_cache_dir, f"auction_bidders-{'-'.join(map(str, version))}.{fmt}")
+        _WRITERS[fmt](db, path)
+
+        if cached and cached[1] != path:
+            # Responses already sending it hold it open, so they finish.
+            os.remove(cached[1])
+        _cached_paths[fmt] = (version, path)
+        logger.info(f"Generated bidders export ({fmt}) for data version {version}")
+        return open(path, "rb")
+
+
+def iter_export(f):
+    """The contents of a file from open_bidders_export(), closing it once
+    read."""
+    with f:
+        while chunk := f.read(_STREAM_CHUNK_BYTES):
+            yield chunk
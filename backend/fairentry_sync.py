@@ -1,26 +1,37 @@
 import asyncio
 import base64
+import contextlib
 import hashlib
+import json
 import logging
 import os
+import time
 from datetime import datetime, timedelta
 
 from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import insert, select, update
 from fairentry_api import FairEntryClient, FairEntryError
 
+import metrics
 from database import (
     Buyer, SaleProgram, BidderLot,
     FairEntryConnection, FairEntrySyncStatus, FairEntrySaleOrderOption,
-    SessionLocal, clamp_current_lot_index,
+    SessionLocal, run_db, realign_current_lot, set_current_lot,
     get_or_create_fairentry_connection, get_or_create_fairentry_sync_status,
-    get_or_create_session,
+    get_or_create_session, mark_buyer_lots_changed, mark_lots_changed, mark_lots_reset,
 )
 from ws_manager import broadcast_message
+from live_state import live_state
 
 logger = logging.getLogger("adbackend")
 
 FAILURE_THRESHOLD = 3
-SYNC_CHECK_TICK_SECONDS = 30
+# After a failed sync the next attempt comes this long after it, doubling
+# with each further consecutive failure, but never later than the interval.
+RETRY_BACKOFF_BASE_SECONDS = 30
+# A pooled, logged-in FairEntry client older than this logs in afresh rather
+# than risk a session that has expired upstream.
+FAIRENTRY_SESSION_MAX_AGE_SECONDS = int(os.getenv("FAIRENTRY_SESSION_MAX_AGE_MINUTES", "30")) * 60
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 _FERNET = Fernet(base64.urlsafe_b64encode(hashlib.sha256(SECRET_KEY.encode("utf-8")).digest()))
@@ -56,6 +67,7 @@ def status_to_dict(status: FairEntrySyncStatus) -> dict:
         "consecutive_failures": status.consecutive_failures,
         "selected_sale_order_id": status.selected_sale_order_id,
         "selected_sale_order_name": status.selected_sale_order_name,
+        **_sync_stats.get(status.target, {}),
     }
 
 
@@ -67,31 +79,145 @@ class _NotConfigured(Exception):
     pass
 
 
-async def _authenticate(connection: FairEntryConnection) -> FairEntryClient:
-    """Build and log in a FairEntryClient using the shared connection
-    credentials, reading them fresh from the DB every call so edits made in
-    Preferences take effect on the very next sync without a restart.
+def _sync_context(db, target: str):
+    """The stored credentials and `target`'s status dict - everything a sync
+    needs from the DB before it talks to FairEntry."""
+    connection = get_or_create_fairentry_connection(db)
+    credentials = {
+        "username": connection.username,
+        "password_encrypted": connection.password_encrypted,
+        "fair_title": connection.fair_title,
+    }
+    return credentials, status_to_dict(get_or_create_fairentry_sync_status(db, target))
 
-    Raises _NotConfigured if credentials are incomplete, or FairEntryError
-    (from the underlying client) if login itself fails.
-    """
-    if not (connection.username and connection.password_encrypted and connection.fair_title):
+
+def _credentials_key(credentials: dict) -> tuple:
+    if not (credentials["username"] and credentials["password_encrypted"] and credentials["fair_title"]):
         raise _NotConfigured("FairEntry credentials not configured")
+    return credentials["username"], credentials["password_encrypted"], credentials["fair_title"]
+
+
+class _ClientPool:
+    """Logged-in FairEntryClients left over from earlier syncs, so a sync
+    only pays for a login when none is idle. Every client belongs to the
+    credentials it logged in with: a sync under different credentials
+    (Preferences were edited) empties the pool. Only touched from the event
+    loop, so concurrent syncs each check out a client of their own."""
+
+    def __init__(self):
+        self.key = None
+        self.idle = []
+
+    def clear(self):
+        self.key = None
+        self.idle = []
+
+    def checkout(self, key):
+        """An idle (client, logged_in_at) for `key`, or None."""
+        if key != self.key:
+            self.clear()
+            self.key = key
+        while self.idle:
+            client, logged_in_at = self.idle.pop()
+            if time.monotonic() - logged_in_at < FAIRENTRY_SESSION_MAX_AGE_SECONDS:
+                return client, logged_in_at
+        return None
+
+    def checkin(self, key, client, logged_in_at):
+        if key == self.key:
+            self.idle.append((client, logged_in_at))
+
+
+_client_pool = _ClientPool()
+
+# Per-target upstream stats since startup, merged into status_to_dict().
+_sync_stats = {
+    target: {"login_count": 0, "last_sync_ms": None, "last_upstream_ms": None}
+    for target in ("buyers", "sale")
+}
+_sync_started = {}
+
+
+def reset_client_pool():
+    """Drop every pooled client - call when the stored credentials change."""
+    _client_pool.clear()
+
+
+class _FairEntrySession:
+    """One sync's use of FairEntry, see _fairentry_session()."""
+
+    def __init__(self, credentials: dict, target: str):
+        self.key = _credentials_key(credentials)
+        self.credentials = credentials
+        self.target = target
+        self.client = None
+        self.logged_in_at = None
+        self.reused = False
+        self.upstream_seconds = 0.0
+
+    async def call(self, method: str, *args):
+        """Call FairEntryClient.`method` on a logged-in client. If a pooled
+        client fails, its session may just have expired upstream - log in
+        again and retry once before giving up."""
+        started = time.perf_counter()
+        try:
+            if self.client is None:
+                pooled = _client_pool.checkout(self.key)
+                if pooled:
+                    (self.client, self.logged_in_at), self.reused = pooled, True
+                else:
+                    await self._login()
+            try:
+                return await self._fetch(method, *args)
+            except FairEntryError:
+                if not self.reused:
+                    raise
+                logger.info(f"Pooled FairEntry session failed on {method}, logging in again")
+                await self._login()
+                return await self._fetch(method, *args)
+        finally:
+            self.upstream_seconds += time.perf_counter() - started
+            _sync_stats[self.target]["last_upstream_ms"] = round(self.upstream_seconds * 1000)
 
-    try:
-        password = decrypt_password(connection.password_encrypted)
-    except InvalidToken:
-        raise FairEntryError("Stored password could not be decrypted; re-enter it in Preferences")
+    async def _fetch(self, method: str, *args):
+        with metrics.sync_phase_seconds.time(self.target, "fetch"):
+            return await asyncio.to_thread(getattr(self.client, method), *args)
+
+    async def _login(self):
+        """Log in a new FairEntryClient with the shared connection
+        credentials. Raises FairEntryError (from the underlying client) if
+        login itself fails."""
+        try:
+            password = decrypt_password(self.credentials["password_encrypted"])
+        except InvalidToken:
+            raise FairEntryError("Stored password could not be decrypted; re-enter it in Preferences")
+
+        client = FairEntryClient()
+        with metrics.sync_phase_seconds.time(self.target, "auth"):
+            await asyncio.to_thread(client.authenticate, self.credentials["username"], password, self.credentials["fair_title"])
+        self.client, self.logged_in_at, self.reused = client, time.monotonic(), False
+        _sync_stats[self.target]["login_count"] += 1
 
-    client = FairEntryClient()
-    await asyncio.to_thread(client.authenticate, connection.username, password, connection.fair_title)
-    return client
+
+@contextlib.asynccontextmanager
+async def _fairentry_session(credentials: dict, target: str):
+    """FairEntry access for one sync, using the credentials read fresh from
+    the DB at its start so edits made in Preferences take effect on the very
+    next sync without a restart. The client goes back to the pool when the
+    block exits normally, and is discarded if it raises.
+
+    Raises _NotConfigured if credentials are incomplete."""
+    session = _FairEntrySession(credentials, target)
+    yield session
+    if session.client is not None:
+        _client_pool.checkin(session.key, session.client, session.logged_in_at)
 
 
 _sync_locks = {"buyers": asyncio.Lock(), "sale": asyncio.Lock()}
 
 
-async def _record_failure(db, status: FairEntrySyncStatus, error_message: str):
+def _record_failure(db, target: str, error_message: str) -> dict:
+    status = get_or_create_fairentry_sync_status(db, target)
     status.last_sync_at = datetime.utcnow()
     status.last_sync_status = "error"
     status.consecutive_failures = (status.consecutive_failures or 0) + 1
@@ -105,11 +231,36 @@ async def _record_failure(db, status: FairEntrySyncStatus, error_message: str):
         status.last_sync_message = error_message
 
     db.commit()
-    logger.error(f"FairEntry {status.target} sync failed: {status.last_sync_message}")
+    logger.error(f"FairEntry {target} sync failed: {status.last_sync_message}")
+    return status_to_dict(status)
+
+
+def _record_success(status: FairEntrySyncStatus, message: str, outcome: str = "success"):
+    status.last_sync_at = datetime.utcnow()
+    status.last_sync_status = outcome
+    status.last_sync_message = message
+    status.consecutive_failures = 0
+
 
+def _fingerprint(*payload) -> str:
+    """Content hash of a fetched payload, compared against the status row's
+    payload_fingerprint to tell whether a sync has anything to apply."""
+    return hashlib.sha256(json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
 
-async def _broadcast_status(status: FairEntrySyncStatus, result: dict, extra_type: str = None):
-    await broadcast_message({"type": f"fairentry_{status.target}_sync_status", **status_to_dict(status)})
+
+async def _fail(db, target: str, error_message: str) -> dict:
+    result = {"status": "error", "message": error_message}
+    status = await run_db(_record_failure, db, target, error_message, write=True)
+    await _broadcast_status(status, result)
+    return result
+
+
+async def _broadcast_status(status: dict, result: dict, extra_type: str = None):
+    # Every sync ends with this broadcast, so it's where its duration is known.
+    target = status["target"]
+    if target in _sync_started:
+        _sync_stats[target]["last_sync_ms"] = round((time.perf_counter() - _sync_started.pop(target)) * 1000)
+    await broadcast_message({"type": f"fairentry_{target}_sync_status", **status, **_sync_stats[target]})
     if extra_type and result.get("status") == "success":
         await broadcast_message({"type": extra_type})
     if result.get("status") in ("success", "error"):
@@ -120,36 +271,42 @@ async def perform_buyer_sync(db) -> dict:
     """Fetch the buyer list from FairEntry and upsert it into the Buyer table.
     Additive only - never deletes a buyer that's disappeared upstream."""
     async with _sync_locks["buyers"]:
+        _sync_started["buyers"] = time.perf_counter()
         return await _perform_buyer_sync_locked(db)
 
 
 async def _perform_buyer_sync_locked(db) -> dict:
-    connection = get_or_create_fairentry_connection(db)
-    status = get_or_create_fairentry_sync_status(db, "buyers")
+    credentials, status = await run_db(_sync_context, db, "buyers", write=True)
 
     try:
-        client = await _authenticate(connection)
+        async with _fairentry_session(credentials, "buyers") as fairentry:
+            fe_buyers = await fairentry.call("get_buyers", True)
     except _NotConfigured as e:
         result = {"status": "skipped", "message": str(e)}
         await _broadcast_status(status, result)
         return result
     except FairEntryError as e:
-        result = {"status": "error", "message": str(e)}
-        await _record_failure(db, status, result["message"])
-        await _broadcast_status(status, result)
-        return result
+        return await _fail(db, "buyers", str(e))
 
-    try:
-        fe_buyers = await asyncio.to_thread(client.get_buyers, True)
-    except FairEntryError as e:
-        result = {"status": "error", "message": str(e)}
-        await _record_failure(db, status, result["message"])
-        await _broadcast_status(status, result)
-        return result
+    with metrics.sync_phase_seconds.time("buyers", "apply"):
+        result, status = await run_db(_apply_buyers, db, fe_buyers, write=True)
+    logger.info(result["message"])
+    await _broadcast_status(status, result, extra_type="buyers_updated")
+    return result
+
+
+def _apply_buyers(db, fe_buyers):
+    status = get_or_create_fairentry_sync_status(db, "buyers")
+    fingerprint = _fingerprint(sorted([str(fe_buyer.identifier), fe_buyer.name or ""] for fe_buyer in fe_buyers))
+    if status.payload_fingerprint == fingerprint:
+        message = "FairEntry buyer sync: buyer list unchanged since last sync"
+        _record_success(status, message, "unchanged")
+        db.commit()
+        return {"status": "unchanged", "message": message}, status_to_dict(status)
 
     existing_buyers = {buyer.identifier: buyer for buyer in db.query(Buyer).all()}
     added_count = 0
-    updated_count = 0
+    renamed_ids = []
     skipped = []
 
     for fe_buyer in fe_buyers:
@@ -165,141 +322,208 @@ async def _perform_buyer_sync_locked(db) -> dict:
             existing_buyer = existing_buyers[identifier_int]
             if existing_buyer.name != name_str:
                 existing_buyer.name = name_str
-                updated_count += 1
+                renamed_ids.append(existing_buyer.id)
         else:
             db.add(Buyer(identifier=identifier_int, name=name_str))
             added_count += 1
 
+    updated_count = len(renamed_ids)
+    mark_buyer_lots_changed(db, renamed_ids)
     message = f"FairEntry buyer sync: {added_count} added, {updated_count} updated"
     if skipped:
         message += f" ({len(skipped)} buyer(s) skipped - non-numeric identifier)"
         logger.warning(f"FairEntry buyer sync skipped non-numeric identifiers: {skipped}")
 
-    status.last_sync_at = datetime.utcnow()
-    status.last_sync_status = "success"
-    status.last_sync_message = message
-    status.consecutive_failures = 0
+    _record_success(status, message)
+    status.payload_fingerprint = fingerprint
     db.commit()
+    live_state.reload(db)
 
-    logger.info(message)
     result = {"status": "success", "message": message, "added": added_count, "updated": updated_count}
-    await _broadcast_status(status, result, extra_type="buyers_updated")
-    return result
+    return result, status_to_dict(status)
 
 
 async def perform_sale_sync(db) -> dict:
     """Fetch the selected Sale Order from FairEntry and mirror it into the
-    SaleProgram table. Unlike buyer sync this is a full replace, not an
-    upsert: the Sale List must end up 100% matching the source and strictly
-    ordered by lot number, so stale/removed/renumbered lots can't linger."""
+    SaleProgram table. Unlike buyer sync this removes lots too: the Sale List
+    must end up 100% matching the source and strictly ordered by lot number,
+    so stale/removed/renumbered lots can't linger."""
     async with _sync_locks["sale"]:
+        _sync_started["sale"] = time.perf_counter()
         return await _perform_sale_sync_locked(db)
 
 
 async def _perform_sale_sync_locked(db) -> dict:
-    connection = get_or_create_fairentry_connection(db)
-    status = get_or_create_fairentry_sync_status(db, "sale")
+    credentials, status = await run_db(_sync_context, db, "sale", write=True)
 
     try:
-        client = await _authenticate(connection)
+        async with _fairentry_session(credentials, "sale") as fairentry:
+            if not status["selected_sale_order_id"]:
+                sale_orders = await fairentry.call("get_sale_orders", True)
+                if len(sale_orders) != 1:
+                    message = (
+                        "No Sale Orders found in FairEntry" if not sale_orders
+                        else "Multiple Sale Orders exist — select one in the Sale List tab"
+                    )
+                    result = {"status": "skipped", "message": message}
+                    await _broadcast_status(status, result)
+                    return result
+                status = await run_db(_select_sole_sale_order, db, sale_orders[0], write=True)
+
+            sale_order_id = status["selected_sale_order_id"]
+            detail = await fairentry.call("get_sale_order", sale_order_id, True)
     except _NotConfigured as e:
         result = {"status": "skipped", "message": str(e)}
         await _broadcast_status(status, result)
         return result
     except FairEntryError as e:
-        result = {"status": "error", "message": str(e)}
-        await _record_failure(db, status, result["message"])
-        await _broadcast_status(status, result)
-        return result
+        return await _fail(db, "sale", str(e))
 
-    if not status.selected_sale_order_id:
-        try:
-            sale_orders = await asyncio.to_thread(client.get_sale_orders, True)
-        except FairEntryError as e:
-            result = {"status": "error", "message": str(e)}
-            await _record_failure(db, status, result["message"])
-            await _broadcast_status(status, result)
-            return result
-
-        if len(sale_orders) == 1:
-            status.selected_sale_order_id = sale_orders[0].id
-            status.selected_sale_order_name = sale_orders[0].name
-            db.commit()
-        else:
-            message = (
-                "No Sale Orders found in FairEntry" if not sale_orders
-                else "Multiple Sale Orders exist — select one in the Sale List tab"
-            )
-            result = {"status": "skipped", "message": message}
-            await _broadcast_status(status, result)
-            return result
+    with metrics.sync_phase_seconds.time("sale", "apply"):
+        result, status = await run_db(_apply_sale_order, db, sale_order_id, detail, write=True)
+    logger.info(result["message"])
+    await _broadcast_status(status, result, extra_type="sale_updated")
+    return result
 
-    try:
-        detail = await asyncio.to_thread(client.get_sale_order, status.selected_sale_order_id, True)
-    except FairEntryError as e:
-        result = {"status": "error", "message": str(e)}
-        await _record_failure(db, status, result["message"])
-        await _broadcast_status(status, result)
-        return result
 
-    entries = detail.entries_sorted_by_sale_number()
-    sale_order_id = status.selected_sale_order_id
+def _select_sole_sale_order(db, sale_order) -> dict:
+    status = get_or_create_fairentry_sync_status(db, "sale")
+    if status.selected_sale_order_id != sale_order.id:
+        mark_lots_reset(db)
+    status.selected_sale_order_id = sale_order.id
+    status.selected_sale_order_name = sale_order.name
+    db.commit()
+    return status_to_dict(status)
 
-    # Full replace, scoped to this Sale Order only - a sync is a mirror of
-    # the source, not a merge, but other Sale Orders' cached rows are left
-    # alone so switching the dropdown selection doesn't need a re-sync.
-    stale_lot_ids = [
-        row.id for row in db.query(SaleProgram.id)
-        .filter(SaleProgram.sale_order_id == sale_order_id).all()
-    ]
-    if stale_lot_ids:
-        db.query(BidderLot).filter(BidderLot.lot_id.in_(stale_lot_ids)).delete(synchronize_session=False)
-        db.query(SaleProgram).filter(SaleProgram.id.in_(stale_lot_ids)).delete(synchronize_session=False)
 
+def _diff_sale_entries(existing_rows, entries) -> dict:
+    """Compare the lots cached for a Sale Order with the entries FairEntry
+    just returned, matched on fairentry_entry_id. Returns the rows to insert,
+    the (id, fields) to update - split into edited and only reordered - and
+    the lot ids to remove. Cached rows with no matching entry (removed
+    upstream, or uploaded by hand under this Sale Order) are removed, so the
+    result still mirrors the source exactly."""
+    existing_by_entry = {}
+    removed = []
+    for row in existing_rows:
+        if row.fairentry_entry_id is None or row.fairentry_entry_id in existing_by_entry:
+            removed.append(row.id)
+        else:
+            existing_by_entry[row.fairentry_entry_id] = row
+
+    inserted, updated, reordered = [], [], []
     for index, entry in enumerate(entries):
-        db.add(SaleProgram(
-            lot_number=str(entry.sale_number),
-            student_name=entry.exhibitor_name or "",
-            department=entry.department_name or "",
-            sort_order=index,
-            fairentry_entry_id=entry.id,
-            sale_order_id=sale_order_id,
-        ))
+        fields = {
+            "lot_number": str(entry.sale_number),
+            "student_name": entry.exhibitor_name or "",
+            "department": entry.department_name or "",
+            "sort_order": index,
+        }
+        row = existing_by_entry.pop(entry.id, None)
+        if row is None:
+            inserted.append({**fields, "fairentry_entry_id": entry.id})
+        elif (row.lot_number, row.student_name, row.department) != (
+                fields["lot_number"], fields["student_name"], fields["department"]):
+            updated.append({"id": row.id, **fields})
+        elif row.sort_order != index:
+            reordered.append({"id": row.id, "sort_order": index})
+
+    removed.extend(row.id for row in existing_by_entry.values())
+    return {"inserted": inserted, "updated": updated, "reordered": reordered, "removed": removed}
+
+
+def _apply_sale_order(db, sale_order_id: int, detail):
+    entries = detail.entries_sorted_by_sale_number()
+    status = get_or_create_fairentry_sync_status(db, "sale")
+    fingerprint = _fingerprint(
+        sale_order_id, detail.config.name,
+        [[entry.id, entry.sale_number, entry.exhibitor_name, entry.department_name] for entry in entries],
+    )
+    if status.payload_fingerprint == fingerprint:
+        message = f"FairEntry sale sync: '{detail.config.name}' unchanged since last sync"
+        _record_success(status, message, "unchanged")
+        db.commit()
+        return {"status": "unchanged", "message": message, "lot_count": len(entries)}, status_to_dict(status)
+
+    # Diff against this Sale Order's cached rows and apply only what changed,
+    # so lot ids - and the bids recorded against them - survive a re-sync.
+    # Other Sale Orders' cached rows are left alone so switching the dropdown
+    # selection doesn't need a re-sync.
+    existing_rows = db.execute(
+        select(SaleProgram.id, SaleProgram.fairentry_entry_id, SaleProgram.lot_number,
+               SaleProgram.student_name, SaleProgram.department, SaleProgram.sort_order)
+        .where(SaleProgram.sale_order_id == sale_order_id)
+    ).all()
+    diff = _diff_sale_entries(existing_rows, entries)
+    changed = any(diff.values())
+    old_order = {row.id: row.sort_order for row in existing_rows}
+    if diff["inserted"] or diff["removed"] or diff["reordered"] or any(
+            row["sort_order"] != old_order[row["id"]] for row in diff["updated"]):
+        mark_lots_reset(db)
+    else:
+        mark_lots_changed(db, [row["id"] for row in diff["updated"]])
 
-    session = get_or_create_session(db)
-    clamp_current_lot_index(session, len(entries))
+    if diff["removed"]:
+        db.query(BidderLot).filter(BidderLot.lot_id.in_(diff["removed"])).delete(synchronize_session=False)
+        db.query(SaleProgram).filter(SaleProgram.id.in_(diff["removed"])).delete(synchronize_session=False)
+    if diff["inserted"]:
+        db.execute(insert(SaleProgram), [{**row, "sale_order_id": sale_order_id} for row in diff["inserted"]])
+    for rows in (diff["updated"], diff["reordered"]):
+        if rows:
+            db.execute(update(SaleProgram), rows)
 
-    message = f"FairEntry sale sync: {len(entries)} lot(s) loaded from '{detail.config.name}'"
-    status.last_sync_at = datetime.utcnow()
-    status.last_sync_status = "success"
-    status.last_sync_message = message
-    status.consecutive_failures = 0
+    if changed:
+        db.flush()
+        session = get_or_create_session(db)
+        realign_current_lot(db, session)
+        summary = ", ".join(f"{len(diff[kind])} {kind}" for kind in ("inserted", "updated", "reordered", "removed"))
+    else:
+        summary = "no changes"
+
+    message = f"FairEntry sale sync: {len(entries)} lot(s) from '{detail.config.name}' ({summary})"
+    _record_success(status, message)
+    status.payload_fingerprint = fingerprint
     db.commit()
+    if changed:
+        live_state.reload(db)
 
-    logger.info(message)
-    result = {"status": "success", "message": message, "lot_count": len(entries)}
-    await _broadcast_status(status, result, extra_type="sale_updated")
-    return result
+    result = {
+        "status": "success", "message": message, "lot_count": len(entries),
+        **{kind: len(rows) for kind, rows in diff.items()},
+    }
+    return result, status_to_dict(status)
 
 
 async def refresh_sale_order_options(db) -> dict:
     """Re-query FairEntry for the Fair's available Sale Orders and replace
     the cached dropdown options. Auto-selects the sole option when there's
     exactly one and nothing is selected yet, but never triggers a sync."""
-    connection = get_or_create_fairentry_connection(db)
-    status = get_or_create_fairentry_sync_status(db, "sale")
+    credentials, _ = await run_db(_sync_context, db, "sale", write=True)
 
     try:
-        client = await _authenticate(connection)
+        async with _fairentry_session(credentials, "sale") as fairentry:
+            sale_orders = await fairentry.call("get_sale_orders", True)
     except _NotConfigured as e:
         return {"status": "skipped", "message": str(e), "options": []}
     except FairEntryError as e:
         return {"status": "error", "message": str(e), "options": []}
 
-    try:
-        sale_orders = await asyncio.to_thread(client.get_sale_orders, True)
-    except FairEntryError as e:
-        return {"status": "error", "message": str(e), "options": []}
+    status, lots_removed = await run_db(_apply_sale_order_options, db, sale_orders, write=True)
+
+    await broadcast_message({"type": "sale_orders_updated"})
+    await broadcast_message({"type": "fairentry_sale_sync_status", **status})
+    if lots_removed:
+        await broadcast_message({"type": "sale_updated"})
+
+    options = [{"id": so.id, "name": so.name, "entry_count": so.entry_count} for so in sale_orders]
+    return {"status": "success", "message": f"Found {len(options)} sale order(s)", "options": options}
+
+
+def _apply_sale_order_options(db, sale_orders):
+    """Replace the cached Sale Order options. Returns the sale status dict
+    and whether any cached lots were dropped."""
+    status = get_or_create_fairentry_sync_status(db, "sale")
+    selected_before = status.selected_sale_order_id
 
     db.query(FairEntrySaleOrderOption).delete()
     for sale_order in sale_orders:
@@ -317,6 +541,7 @@ async def refresh_sale_order_options(db) -> dict:
     if stale_lot_ids:
         db.query(BidderLot).filter(BidderLot.lot_id.in_(stale_lot_ids)).delete(synchronize_session=False)
         db.query(SaleProgram).filter(SaleProgram.id.in_(stale_lot_ids)).delete(synchronize_session=False)
+        status.payload_fingerprint = None
 
     if status.selected_sale_order_id is not None and status.selected_sale_order_id not in fresh_ids:
         status.selected_sale_order_id = None
@@ -326,15 +551,11 @@ async def refresh_sale_order_options(db) -> dict:
         status.selected_sale_order_id = sale_orders[0].id
         status.selected_sale_order_name = sale_orders[0].name
 
+    if status.selected_sale_order_id != selected_before:
+        mark_lots_reset(db)
     db.commit()
-
-    await broadcast_message({"type": "sale_orders_updated"})
-    await broadcast_message({"type": "fairentry_sale_sync_status", **status_to_dict(status)})
-    if stale_lot_ids:
-        await broadcast_message({"type": "sale_updated"})
-
-    options = [{"id": so.id, "name": so.name, "entry_count": so.entry_count} for so in sale_orders]
-    return {"status": "success", "message": f"Found {len(options)} sale order(s)", "options": options}
+    live_state.reload(db)
+    return status_to_dict(status), bool(stale_lot_ids)
 
 
 def select_sale_order(db, sale_order_id: int) -> dict:
@@ -354,34 +575,73 @@ def select_sale_order(db, sale_order_id: int) -> dict:
         # A different Sale Order's lots have no relationship to the previous
         # position - resetting avoids pointing at a lot that means nothing here.
         session = get_or_create_session(db)
-        session.current_lot_index = -1
+        set_current_lot(session, -1, None)
+        mark_lots_reset(db)
 
     db.commit()
     return status_to_dict(status)
 
 
-async def _maybe_run_due_sync(db, target: str, perform_fn):
+def _seconds_until_due(db, target: str):
+    """How long until `target` is next due for an auto-sync (<= 0 means it
+    is due now), or None while auto-sync is disabled."""
     status = get_or_create_fairentry_sync_status(db, target)
     if not status.sync_enabled:
-        return
+        return None
+    if not status.last_sync_at:
+        return 0
 
-    interval = timedelta(minutes=status.sync_interval_minutes or 15)
-    if status.last_sync_at and datetime.utcnow() - status.last_sync_at < interval:
-        return
+    wait = (status.sync_interval_minutes or 15) * 60
+    if status.last_sync_status == "error" and status.consecutive_failures:
+        wait = min(wait, RETRY_BACKOFF_BASE_SECONDS * 2 ** (status.consecutive_failures - 1))
+    return (status.last_sync_at + timedelta(seconds=wait) - datetime.utcnow()).total_seconds()
 
-    await perform_fn(db)
 
+_wake_events = {"buyers": asyncio.Event(), "sale": asyncio.Event()}
 
-async def fairentry_sync_loop():
-    """Background task: periodically checks whether either sync target
-    (buyers or sale) is due for an auto-sync."""
+
+def wake_sync_scheduler(target: str):
+    """Make `target`'s scheduler re-read its settings now - call after
+    changing its interval or enabling/disabling it."""
+    _wake_events[target].set()
+
+
+async def _sync_scheduler(target: str, perform_fn):
+    """Run `target`'s auto-syncs: sleep exactly until the next one is due,
+    or until woken by wake_sync_scheduler(). Each target has its own task
+    and DB sessions, so a slow buyer download never delays the sale sync."""
+    wake_event = _wake_events[target]
     while True:
-        await asyncio.sleep(SYNC_CHECK_TICK_SECONDS)
+        # Any wake so far is covered by the settings about to be read.
+        wake_event.clear()
+        delay = None
         db = SessionLocal()
         try:
-            await _maybe_run_due_sync(db, "buyers", perform_buyer_sync)
-            await _maybe_run_due_sync(db, "sale", perform_sale_sync)
+            delay = await run_db(_seconds_until_due, db, target, write=True)
+            if delay is not None and delay <= 0:
+                result = await perform_fn(db)
+                if result.get("status") != "skipped":
+                    continue
+                # A skipped run (no credentials, no Sale Order to pick)
+                # records no sync time, so it would be due again at once.
+                # Retry after the backoff instead - or sooner, if woken by
+                # a settings change.
+                delay = RETRY_BACKOFF_BASE_SECONDS
         except Exception:
-            logger.exception("Unexpected error in FairEntry sync loop")
+            logger.exception(f"Unexpected error in FairEntry {target} sync scheduler")
+            delay = RETRY_BACKOFF_BASE_SECONDS
         finally:
-            db.close()
+            await run_db(db.close)
+
+        try:
+            await asyncio.wait_for(wake_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def fairentry_sync_loop():
+    """Background task: one scheduler per sync target (buyers and sale)."""
+    await asyncio.gather(
+        _sync_scheduler("buyers", perform_buyer_sync),
+        _sync_scheduler("sale", perform_sale_sync),
+    )
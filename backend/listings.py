@@ -0,0 +1,228 @@
+"""Paged, filtered reads of the Sale Program, buyer list and reviewer lots,
+with weak ETags so a client whose copy is current gets a 304 instead of
+the whole table again.
+
+Pages are keyset-based: the cursor is the sort key of the last row sent, so
+fetching page N costs the same as page 1 and a write between pages can't
+shift rows into the gap or repeat them. Without a limit, every matching row
+comes back in one response, as before.
+
+ETags are built from the table versions in database.py, which only move
+when a write to that table commits. Those counters restart with the
+process, so the ETag also carries a per-boot epoch - otherwise a client
+holding a tag from before a restart could be told its stale copy is
+current.
+
+The reviewer screen also follows the review change feed (see
+mark_lots_changed in database.py): review_changes() returns just the lots
+changed since the version the client last saw. Blocking - run these in a DB
+worker thread."""
+import os
+from typing import NamedTuple
+
+from fastapi import HTTPException
+from sqlalchemy import String, cast, or_, tuple_
+from sqlalchemy.orm import joinedload
+
+from database import (
+    AuctionSession, BidderLot, Buyer, LotChange, SaleProgram, data_version, get_active_sale_order_id, lot_bidders, ordered_lots,
+)
+
+MAX_PAGE_SIZE = 1000
+
+_EPOCH = os.urandom(4).hex()
+
+_SALE_TABLES = ("sale_programs", "fairentry_sync_status")
+_BUYER_TABLES = ("buyers",)
+_REVIEW_TABLES = ("sale_programs", "fairentry_sync_status", "bidders_per_lot", "buyers")
+
+
+class Page(NamedTuple):
+    etag: str
+    # None when the client's If-None-Match already names the current version.
+    rows: list | None
+    next_cursor: str | None
+    # The review change version the rows are at, for review pages.
+    review_version: int | None = None
+
+
+def _etag(tables) -> str:
+    return f'W/"{_EPOCH}-{"-".join(map(str, data_version(*tables)))}"'
+
+
+def _is_current(etag: str, if_none_match: str | None) -> bool:
+    # If-None-Match uses the weak comparison, so W/ is ignored on both sides.
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def _check_limit(limit: int | None):
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+
+def _cursor_key(cursor: str, size: int) -> tuple:
+    try:
+        key = tuple(int(part) for part in cursor.split(":"))
+    except ValueError:
+        key = ()
+    if len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def _lot_key(db, lot_number: str) -> tuple:
+    """ordered_lots() sort key of a lot in the active Sale Order."""
+    key = (
+        db.query(SaleProgram.sort_order, SaleProgram.id)
+        .filter(SaleProgram.sale_order_id == get_active_sale_order_id(db), SaleProgram.lot_number == lot_number)
+        .order_by(SaleProgram.sort_order, SaleProgram.id)
+        .first()
+    )
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"Lot {lot_number} not found")
+    return tuple(key)
+
+
+def _filtered_lots(db, cursor, department, lot_from, lot_to, q):
+    """ordered_lots() narrowed by the filters and resumed after `cursor`.
+    lot_from/lot_to are lot numbers and bound the range in sale order
+    (inclusive), since lot numbers themselves needn't sort numerically."""
+    order_key = tuple_(SaleProgram.sort_order, SaleProgram.id)
+    query = ordered_lots(db)
+    if department:
+        query = query.filter(SaleProgram.department == department)
+    if lot_from:
+        query = query.filter(order_key >= _lot_key(db, lot_from))
+    if lot_to:
+        query = query.filter(order_key <= _lot_key(db, lot_to))
+    if q:
+        query = query.filter(or_(
+            SaleProgram.lot_number.icontains(q, autoescape=True),
+            SaleProgram.student_name.icontains(q, autoescape=True),
+        ))
+    if cursor:
+        query = query.filter(order_key > _cursor_key(cursor, 2))
+    return query
+
+
+def _review_versions(db) -> tuple:
+    """(current change version, last reset version). Read it before the
+    lots: versions commit in order, so the lots read after it include every
+    change up to it - and maybe some newer ones, which a client just gets
+    again next time."""
+    row = (
+        db.query(AuctionSession.change_version, AuctionSession.review_reset_version)
+        .filter(AuctionSession.is_active == True)
+        .first()
+    )
+    return (row[0] or 0, row[1] or 0) if row else (0, 0)
+
+
+def _review_row(lot) -> dict:
+    return {
+        "LotId": lot.id,
+        "LotNumber": lot.lot_number,
+        "StudentName": lot.student_name,
+        "Department": lot.department,
+        "Bidders": lot_bidders(lot),
+    }
+
+
+def _with_bidders(query):
+    # Same single query as lots_with_bidders(); with a limit, SQLAlchemy
+    # wraps the lot query in a subquery so the joined bids don't eat into it.
+    return query.options(joinedload(SaleProgram.bidders).joinedload(BidderLot.buyer))
+
+
+def _page(items: list, limit: int | None, key) -> tuple:
+    """Trim a limit + 1 fetch to `limit` rows, and the cursor for the next
+    page if that extra row showed there is one."""
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, ":".join(map(str, key(items[-1])))
+
+
+def sale_page(db, if_none_match=None, limit=None, cursor=None, department=None, lot_from=None, lot_to=None, q=None) -> Page:
+    _check_limit(limit)
+    # Read the version before the data: a write landing mid-read then only
+    # makes the next request miss, never serves new data under an old tag.
+    etag = _etag(_SALE_TABLES)
+    if _is_current(etag, if_none_match):
+        return Page(etag, None, None)
+    query = _filtered_lots(db, cursor, department, lot_from, lot_to, q)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    lots, next_cursor = _page(query.all(), limit, lambda lot: (lot.sort_order, lot.id))
+    rows = [
+        {
+            "LotNumber": lot.lot_number,
+            "StudentName": lot.student_name,
+            "Department": lot.department
+        }
+        for lot in lots
+    ]
+    return Page(etag, rows, next_cursor)
+
+
+def review_page(db, if_none_match=None, limit=None, cursor=None, department=None, lot_from=None, lot_to=None, q=None) -> Page:
+    _check_limit(limit)
+    etag = _etag(_REVIEW_TABLES)
+    version, _ = _review_versions(db)
+    if _is_current(etag, if_none_match):
+        return Page(etag, None, None, version)
+    query = _filtered_lots(db, cursor, department, lot_from, lot_to, q)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    lots, next_cursor = _page(_with_bidders(query).all(), limit, lambda lot: (lot.sort_order, lot.id))
+    return Page(etag, [_review_row(lot) for lot in lots], next_cursor, version)
+
+
+def review_changes(db, since: int, department=None, lot_from=None, lot_to=None, q=None) -> dict:
+    """The reviewer lots (with the same filters as review_page()) whose
+    details or bidders changed after change version `since`, keyed by
+    LotId so the client can patch them in place. `reset` means the lot list
+    itself changed since then - or `since` comes from some other database -
+    and the client has to reload it whole."""
+    version, reset_version = _review_versions(db)
+    if since < reset_version or since > version:
+        return {"version": version, "reset": True, "lots": []}
+    query = (
+        _filtered_lots(db, None, department, lot_from, lot_to, q)
+        .join(LotChange, LotChange.lot_id == SaleProgram.id)
+        .filter(LotChange.change_version > since)
+    )
+    return {"version": version, "reset": False, "lots": [_review_row(lot) for lot in _with_bidders(query).all()]}
+
+
+def buyer_page(db, if_none_match=None, limit=None, cursor=None, q=None) -> Page:
+    """Buyers in the order they were added, optionally only those whose
+    name contains `q` or whose bidder number starts with it."""
+    _check_limit(limit)
+    etag = _etag(_BUYER_TABLES)
+    if _is_current(etag, if_none_match):
+        return Page(etag, None, None)
+    query = db.query(Buyer).order_by(Buyer.id)
+    if q:
+        query = query.filter(or_(
+            Buyer.name.icontains(q, autoescape=True),
+            cast(Buyer.identifier, String).startswith(q, autoescape=True),
+        ))
+    if cursor:
+        query = query.filter(Buyer.id > _cursor_key(cursor, 1)[0])
+    if limit is not None:
+        query = query.limit(limit + 1)
+    buyers, next_cursor = _page(query.all(), limit, lambda buyer: (buyer.id,))
+    rows = [
+        {
+            "Identifier": buyer.identifier,
+            "Name": buyer.name
+        }
+        for buyer in buyers
+    ]
+    return Page(etag, rows, next_cursor)
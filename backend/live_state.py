@@ -0,0 +1,193 @@
+import logging
+import os
+import threading
+import time
+
+from bid_journal import bid_journal
+from buyer_index import BuyerIndex
+from database import Buyer, SaleProgram, DEFAULT_THEME, get_or_create_session, lot_bidders, lots_with_bidders
+
+logger = logging.getLogger("adbackend")
+
+# Compare the in-memory state against a fresh DB read on every /api/state and
+# broadcast. Far too slow for a live sale - meant for tests and debugging.
+LIVE_STATE_VERIFY = os.getenv("LIVE_STATE_VERIFY", "").lower() in ("1", "true", "yes")
+
+
+class LiveStateMismatch(AssertionError):
+    pass
+
+
+def _lot_to_dict(lot: SaleProgram) -> dict:
+    return {
+        "id": lot.id,
+        "LotNumber": lot.lot_number,
+        "StudentName": lot.student_name,
+        "Department": lot.department,
+    }
+
+
+def _non_empty(bidders_by_lot: dict) -> dict:
+    # remove_bidder() leaves an empty list behind where a fresh load has no key
+    return {lot_id: bidders for lot_id, bidders in bidders_by_lot.items() if bidders}
+
+
+class LiveState:
+    """Process-wide copy of what the displays show: the active Sale Order's
+    lots in order, every lot's recorded bidders, the current lot index and
+    the theme. Loaded once from SQLite and then kept up to date in place by
+    the endpoints that change it, so broadcast_state and /api/state never
+    have to go back to the DB.
+
+    Bulk changes (uploads, FairEntry syncs, merges, Sale Order switches) just
+    call reload() after committing - they're rare, and re-deriving everything
+    is far less error-prone than patching it.
+
+    Every change bumps `seq`, which is carried on snapshots and on the
+    bidder_added/bidder_removed delta frames so a display can tell whether
+    it has missed anything. It starts from the boot time in milliseconds
+    rather than 0, so it keeps increasing across a backend restart.
+
+    Changes are made on the DB writer thread, right after the commit they
+    mirror - except new bids, which are applied on the event loop the moment
+    they're journaled and only reach the DB on the next bid journal flush.
+    reload() re-applies any still pending, so they survive it. `lock` makes
+    each change atomic as far as a snapshot is concerned.
+
+    `buyers` maps every known bidder identifier to its name, so a bid can be
+    validated without a query, and `buyer_index` answers the bidder-entry
+    autocomplete from the same list."""
+
+    def __init__(self):
+        self.loaded = False
+        self.verify = LIVE_STATE_VERIFY
+        self.lots = []
+        self.bidders_by_lot = {}
+        self.buyers = {}
+        self.buyer_index = BuyerIndex({})
+        self.current_lot_index = -1
+        self.theme = DEFAULT_THEME
+        self.seq = int(time.time() * 1000)
+        self.lock = threading.RLock()
+
+    def reload(self, db):
+        session = get_or_create_session(db)
+        lots = []
+        bidders_by_lot = {}
+        for lot in lots_with_bidders(db):
+            lots.append(_lot_to_dict(lot))
+            bidders = lot_bidders(lot)
+            if bidders:
+                bidders_by_lot[lot.id] = bidders
+        buyers = dict(db.query(Buyer.identifier, Buyer.name))
+        # Built before taking the lock - sorting every name can take a while
+        # on a large sale, and bids shouldn't wait on it.
+        buyer_index = BuyerIndex(buyers)
+
+        with self.lock:
+            self.lots = lots
+            self.bidders_by_lot = bidders_by_lot
+            self.buyers = buyers
+            self.buyer_index = buyer_index
+            # Bids taken since the journal flush that ran ahead of this read.
+            lot_ids = {lot["id"] for lot in lots}
+            for entry in bid_journal.pending_entries():
+                if entry["lot_id"] in lot_ids and not self.has_bidder(entry["lot_id"], entry["identifier"]):
+                    self._append_bidder(entry["lot_id"], entry["identifier"], entry["name"])
+            self.current_lot_index = session.current_lot_index
+            self.theme = session.theme
+            self.loaded = True
+            self.seq += 1
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.reload(db)
+
+    @property
+    def lot_count(self) -> int:
+        return len(self.lots)
+
+    @property
+    def current_lot(self):
+        """The lot at current_lot_index, or None past the end. An index of -1
+        (nothing selected yet) resolves to the first lot, the same as the
+        OFFSET -1 lookup this replaces - SQLite treats a negative OFFSET as 0."""
+        if not self.lots or self.current_lot_index >= len(self.lots):
+            return None
+        return self.lots[max(self.current_lot_index, 0)]
+
+    def find_lot(self, lot_number: str):
+        """(index, lot) of the active sale's lot numbered `lot_number`, or None."""
+        for index, lot in enumerate(self.lots):
+            if lot["LotNumber"] == lot_number:
+                return index, lot
+        return None
+
+    def set_current_lot_index(self, index: int):
+        with self.lock:
+            self.current_lot_index = index
+            self.seq += 1
+
+    def set_theme(self, theme: str):
+        with self.lock:
+            self.theme = theme
+            self.seq += 1
+
+    def has_bidder(self, lot_id: int, identifier: int) -> bool:
+        return any(bidder["Identifier"] == identifier for bidder in self.bidders_by_lot.get(lot_id, []))
+
+    def buyer_name(self, identifier: int):
+        """The known buyer's name, or None for an identifier not seen before."""
+        return self.buyers.get(identifier)
+
+    def search_buyers(self, query: str, limit: int) -> list:
+        """Autocomplete matches for a bidder number or name fragment."""
+        with self.lock:
+            return self.buyer_index.search(query, limit)
+
+    def _append_bidder(self, lot_id: int, identifier: int, name: str):
+        self.bidders_by_lot.setdefault(lot_id, []).append({"Identifier": identifier, "Name": name})
+        if identifier not in self.buyers:
+            self.buyers[identifier] = name
+            self.buyer_index.add(identifier, name)
+
+    def add_bidder(self, lot_id: int, identifier: int, name: str):
+        with self.lock:
+            self._append_bidder(lot_id, identifier, name)
+            self.seq += 1
+
+    def remove_bidder(self, lot_id: int, identifier: int):
+        with self.lock:
+            bidders = self.bidders_by_lot.get(lot_id, [])
+            self.bidders_by_lot[lot_id] = [bidder for bidder in bidders if bidder["Identifier"] != identifier]
+            self.seq += 1
+
+    def snapshot(self) -> dict:
+        """The {lot, bidders, theme, seq} payload shared by /api/state and
+        the `state`/`bid_update` broadcasts."""
+        with self.lock:
+            lot = self.current_lot
+            if not lot:
+                return {"lot": None, "bidders": [], "theme": self.theme, "seq": self.seq}
+
+            lot_info = {key: value for key, value in lot.items() if key != "id"}
+            bidder_info = [
+                {"Identifier": bidder["Identifier"], "Name": bidder["Name"]}
+                for bidder in self.bidders_by_lot.get(lot["id"], [])
+            ]
+            return {"lot": lot_info, "bidders": bidder_info, "theme": self.theme, "seq": self.seq}
+
+    def check_consistency(self, db):
+        """Raise LiveStateMismatch if the in-memory state has drifted from
+        what a fresh read of the DB would produce."""
+        fresh = LiveState()
+        fresh.reload(db)
+        if (fresh.lots != self.lots
+                or fresh.current_lot_index != self.current_lot_index
+                or fresh.theme != self.theme
+                or _non_empty(fresh.bidders_by_lot) != _non_empty(self.bidders_by_lot)):
+            logger.error(f"Live state out of sync with DB: cached={self.snapshot()!r} db={fresh.snapshot()!r}")
+            raise LiveStateMismatch("Live auction state does not match the database")
+
+
+live_state = LiveState()
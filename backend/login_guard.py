@@ -0,0 +1,141 @@
+"""Keeps logins from costing the rest of the backend anything.
+
+bcrypt is slow on purpose - a quarter of a second of CPU per check at the
+default cost. It gets its own small pool here instead of sharing the event
+loop's default executor, so a burst of logins (a shift change, or a script
+guessing passwords) queues behind itself: at most BCRYPT_WORKERS cores go
+to it and the displays, bids and DB threads carry on. Beyond
+LOGIN_MAX_PENDING waiting checks, more logins are turned away outright
+rather than queueing without limit.
+
+Failed logins are also counted per username and per client address, and
+once either goes over its limit within the window, further attempts are
+refused with a 429 before any bcrypt runs at all. Only one login per
+username is checked at a time, so a burst of concurrent guesses can't all
+get past the count before any of them has failed - they line up and all
+but the first few get the 429. The per-address limit is the looser one,
+since a whole venue may share one address. The counts are in memory - a
+restart clears them, which is fine for throttling."""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+LOGIN_MAX_PENDING = int(os.getenv("LOGIN_MAX_PENDING", "16"))
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20"))
+LOGIN_FAILURE_WINDOW_SECONDS = int(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", "300"))
+
+# Usernames/addresses tracked at once - guesses at random usernames mustn't
+# grow this without bound.
+_MAX_TRACKED_KEYS = 10000
+
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+# Only touched on the event loop, so no lock.
+_pending = 0
+# username -> [lock, logins holding or waiting for it]
+_user_locks = {}
+
+
+async def run_bcrypt(fn, *args):
+    """Run a bcrypt call on the bcrypt pool, or raise 503 if too many are
+    already waiting for it."""
+    global _pending
+    if _pending >= LOGIN_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, try again shortly")
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(bcrypt_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+class LoginThrottle:
+    """Recent failed login times per key, over a sliding window."""
+
+    def __init__(self, window_seconds: int):
+        self.window = window_seconds
+        self.failures = {}
+
+    def _recent(self, key, now: float) -> deque:
+        times = self.failures.get(key)
+        if times is None:
+            return deque()
+        while times and times[0] <= now - self.window:
+            times.popleft()
+        if not times:
+            del self.failures[key]
+        return times
+
+    def retry_after(self, key, limit: int) -> float:
+        """Seconds until `key` may try again, or 0 if it may now."""
+        now = time.monotonic()
+        times = self._recent(key, now)
+        if len(times) < limit:
+            return 0
+        return times[-limit] + self.window - now
+
+    def record_failure(self, key):
+        now = time.monotonic()
+        if key not in self.failures and len(self.failures) >= _MAX_TRACKED_KEYS:
+            for stale in list(self.failures):
+                self._recent(stale, now)
+            if len(self.failures) >= _MAX_TRACKED_KEYS:
+                # Still full of live keys: forget the one tracked longest.
+                del self.failures[next(iter(self.failures))]
+        self.failures.setdefault(key, deque()).append(now)
+
+    def reset(self, key):
+        self.failures.pop(key, None)
+
+
+login_throttle = LoginThrottle(LOGIN_FAILURE_WINDOW_SECONDS)
+
+
+def _keys(username: str, client_ip) -> list:
+    keys = [(("user", username.casefold()), LOGIN_MAX_FAILURES)]
+    if client_ip:
+        keys.append((("ip", client_ip), LOGIN_MAX_FAILURES_PER_IP))
+    return keys
+
+
+@asynccontextmanager
+async def one_login_at_a_time(username: str):
+    key = username.casefold()
+    entry = _user_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _user_locks[key]
+
+
+def check_login_allowed(username: str, client_ip):
+    """Raise 429 if this username or address has failed too often lately."""
+    wait = max(login_throttle.retry_after(key, limit) for key, limit in _keys(username, client_ip))
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def record_login(username: str, client_ip, succeeded: bool):
+    if succeeded:
+        # The address keeps its count - one good login shouldn't clear the
+        # way for guessing at other accounts from it.
+        login_throttle.reset(("user", username.casefold()))
+        return
+    for key, _ in _keys(username, client_ip):
+        login_throttle.record_failure(key)
@@ -1,33 +1,48 @@
 import asyncio
+import json
 import logging
 from pathlib import Path
 import logging.config
-import numpy as np
-from fastapi import FastAPI, WebSocket, UploadFile, File, Depends, HTTPException
+from fastapi import FastAPI, WebSocket, UploadFile, File, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, FileResponse
-from pydantic import BaseModel
-import pandas as pd
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 import uvicorn
-import io
 import os
 import shutil
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.orm import Session, aliased
 from database import (
-    init_database, get_db, get_or_create_session, ordered_lots, clamp_current_lot_index,
+    engine, init_database, get_db, run_db, SessionLocal, get_or_create_session,
+    realign_current_lot, set_current_lot, mark_lots_changed, mark_buyer_lots_changed, mark_lots_reset, review_version,
     get_active_sale_order_id, get_or_create_fairentry_connection, get_or_create_fairentry_sync_status,
     SaleProgram, Buyer, BidderLot, AuctionSession, User, FairEntrySaleOrderOption,
     ALLOWED_THEMES
 )
-from auth import authenticate_user, create_access_token, require_auth, create_user, change_user_password, get_all_users, delete_user
+from auth import (
+    create_access_token, decode_token, require_auth, create_user, change_user_password, get_all_users, delete_user,
+    get_password_hash, get_user_password_hash, password_needs_rehash, rehash_user_password, verify_password,
+)
+from login_guard import check_login_allowed, one_login_at_a_time, record_login, run_bcrypt
 from fairentry_sync import (
     encrypt_password, perform_buyer_sync, perform_sale_sync, refresh_sale_order_options,
-    select_sale_order, fairentry_sync_loop, connection_to_dict, status_to_dict,
+    select_sale_order, fairentry_sync_loop, wake_sync_scheduler, reset_client_pool, connection_to_dict, status_to_dict,
     sale_order_option_to_dict,
 )
-from ws_manager import websockets, broadcast_message
+from ws_manager import broadcast_message, broadcast_threadsafe, connect, disconnect, client_count, send_to, WS_DELTA_FRAMES
+from live_state import live_state
+from bulk_import import import_sale_program, import_buyer_list, iter_sheet_chunks, import_chunks
+from exports import open_bidders_export, iter_export, EXPORT_MEDIA_TYPES
+from listings import Page, buyer_page, review_changes, review_page, sale_page
+from bid_journal import bid_journal
+from buyer_index import MAX_SEARCH_RESULTS
+from metrics import METRICS_ENABLED, PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, count_queries, render_metrics
+from profiling import (
+    PROFILING_ENABLED, MAX_CAPTURE_SECONDS, CaptureInProgress, ProfilingMiddleware, capture_profile, profiling_report,
+    trace_queries,
+)
 
 class LoginRequest(BaseModel):
     username: str
@@ -54,6 +69,13 @@ class FairEntrySyncToggleRequest(BaseModel):
 class SaleOrderSelectRequest(BaseModel):
     sale_order_id: int
 
+class BidderBatchRequest(BaseModel):
+    identifiers: list[int]
+    lot_number: str | None = None
+
+class ProfileCaptureRequest(BaseModel):
+    seconds: float = 5
+
 VALID_SYNC_TARGETS = {"buyers": perform_buyer_sync, "sale": perform_sale_sync}
 
 LOGGING_CONFIG = {
@@ -75,7 +97,15 @@ logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger("adbackend")
 
 app = FastAPI()
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+                   # Readable by the admin console when served from another origin.
+                   expose_headers=["ETag", "X-Next-Cursor", "X-Review-Version"])
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    count_queries(engine)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+    trace_queries(engine)
 
 import os
 
@@ -88,6 +118,7 @@ if os.path.exists(frontend_dist_path):
     app.mount("/assets", StaticFiles(directory=os.path.join(frontend_dist_path, "assets")), name="assets")
 
 init_database()
+bid_journal.open()
 
 @app.on_event("startup")
 async def start_fairentry_sync_loop():
@@ -96,10 +127,35 @@ async def start_fairentry_sync_loop():
     # mid-run, silently killing the background loop.
     app.state.fairentry_sync_task = asyncio.create_task(fairentry_sync_loop())
 
+@app.on_event("shutdown")
+async def flush_bid_journal():
+    # Not needed for safety - open() replays anything left behind - but a
+    # clean shutdown shouldn't leave the DB behind the displays.
+    await run_db(bid_journal.flush, write=True)
+
+async def _authenticate(username: str, password: str, db: Session) -> bool:
+    password_hash = await run_db(get_user_password_hash, username, db)
+    if password_hash is None:
+        return False
+    # bcrypt is deliberately slow - check it on its own pool (see
+    # login_guard), off both the event loop and the DB executors, so a burst
+    # of logins stalls neither the displays nor the bid path.
+    if not await run_bcrypt(verify_password, password, password_hash):
+        return False
+    if password_needs_rehash(password_hash):
+        new_hash = await run_bcrypt(get_password_hash, password)
+        await run_db(rehash_user_password, username, password_hash, new_hash, db, write=True)
+    return True
+
 @app.post("/api/auth/login")
-async def login(login_request: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_request: LoginRequest, request: Request, db: Session = Depends(get_db)):
     """Authenticate user and return access token."""
-    if not authenticate_user(login_request.username, login_request.password, db):
+    client_ip = request.client.host if request.client else None
+    async with one_login_at_a_time(login_request.username):
+        check_login_allowed(login_request.username, client_ip)
+        authenticated = await _authenticate(login_request.username, login_request.password, db)
+        record_login(login_request.username, client_ip, authenticated)
+    if not authenticated:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password"
@@ -108,59 +164,72 @@ async def login(login_request: LoginRequest, db: Session = Depends(get_db)):
     access_token = create_access_token(data={"sub": login_request.username})
     return LoginResponse(access_token=access_token, token_type="bearer")
 
+async def _ensure_live_state(db: Session):
+    if not live_state.loaded:
+        await run_db(live_state.ensure_loaded, db, write=True)
+
+def _upload_progress_reporter(label: str):
+    """A progress callback for import_chunks() that reports over the /ws log
+    channel. Must be created on the event loop; called from the worker."""
+    loop = asyncio.get_running_loop()
+
+    def report(rows_done: int):
+        broadcast_threadsafe(loop, {"type": "log", "message": f"{label}: {rows_done:,} rows processed..."})
+    return report
+
+def _disable_auto_sync(db: Session, target: str):
+    """Turn off `target`'s FairEntry auto-sync - a manual upload takes
+    precedence over it. Returns the new status dict, or None if it was
+    already off. Caller commits."""
+    status = get_or_create_fairentry_sync_status(db, target)
+    # The upload rewrote rows the last sync applied, so the next sync must
+    # apply its payload again even if nothing changed upstream.
+    status.payload_fingerprint = None
+    if not status.sync_enabled:
+        return None
+    status.sync_enabled = False
+    return status_to_dict(status)
+
+def _import_sale_program_file(file: UploadFile, db: Session, progress):
+    sale_order_id = get_active_sale_order_id(db)
+    added_count, updated_count = import_chunks(
+        iter_sheet_chunks(file.file, file.filename or ""),
+        lambda df, start_row: import_sale_program(db, df, sale_order_id, start_row),
+        progress,
+    )
+    disabled_status = _disable_auto_sync(db, "sale")
+
+    session = get_or_create_session(db)
+    realign_current_lot(db, session)
+
+    db.commit()
+    live_state.reload(db)
+    return added_count, updated_count, disabled_status
+
+def _import_buyer_list_file(file: UploadFile, db: Session, progress):
+    added_count, updated_count = import_chunks(
+        iter_sheet_chunks(file.file, file.filename or ""),
+        lambda df, start_row: import_buyer_list(db, df, start_row),
+        progress,
+    )
+    disabled_status = _disable_auto_sync(db, "buyers")
+    db.commit()
+    live_state.reload(db)
+    return added_count, updated_count, disabled_status
+
 @app.post("/api/upload/sale_program")
 async def upload_sale_program(file: UploadFile = File(...), db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    df = pd.read_excel(file.file)
-    df.rename(columns={"Sale #": "LotNumber", "Exhibitor": "StudentName", "Department": "Department"}, inplace=True)
-    df.replace({np.nan: None}, inplace=True)
-
-    active_sale_order_id = get_active_sale_order_id(db)
-    existing_lots = {
-        lot.lot_number: lot for lot in
-        db.query(SaleProgram).filter(SaleProgram.sale_order_id == active_sale_order_id).all()
-    }
+    progress = _upload_progress_reporter("Sale program upload")
+    added_count, updated_count, disabled_status = await run_db(
+        _import_sale_program_file, file, db, progress, write=True
+    )
 
-    updated_count = 0
-    added_count = 0
-
-    for index, row in df.iterrows():
-        lot_number_str = str(row.get("LotNumber", ""))
-        student_name_str = str(row.get("StudentName", ""))
-        department_str = str(row.get("Department", ""))
-
-        if lot_number_str in existing_lots:
-            existing_lot = existing_lots[lot_number_str]
-            if (existing_lot.student_name != student_name_str or
-                existing_lot.department != department_str):
-                existing_lot.student_name = student_name_str
-                existing_lot.department = department_str
-                updated_count += 1
-            existing_lot.sort_order = index
-        else:
-            lot = SaleProgram(
-                lot_number=lot_number_str,
-                student_name=student_name_str,
-                department=department_str,
-                sort_order=index,
-                sale_order_id=active_sale_order_id
-            )
-            db.add(lot)
-            added_count += 1
-
-    sale_sync_status = get_or_create_fairentry_sync_status(db, "sale")
-    if sale_sync_status.sync_enabled:
-        sale_sync_status.sync_enabled = False
-        db.commit()
+    if disabled_status:
         disable_message = "Sale auto-sync disabled: manual Sale List upload took precedence"
         logger.info(disable_message)
-        await broadcast_message({"type": "fairentry_sale_sync_status", **status_to_dict(sale_sync_status)})
+        await broadcast_message({"type": "fairentry_sale_sync_status", **disabled_status})
         await broadcast_message({"type": "log", "message": disable_message})
 
-    db.flush()
-    session = get_or_create_session(db)
-    clamp_current_lot_index(session, ordered_lots(db).count())
-
-    db.commit()
     message = f"Sale program processed: {added_count} added, {updated_count} updated"
     logger.info(message)
     await broadcast_state(db)
@@ -169,156 +238,159 @@ async def upload_sale_program(file: UploadFile = File(...), db: Session = Depend
 
 @app.post("/api/upload/buyer_list")
 async def upload_buyer_list(file: UploadFile = File(...), db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    df = pd.read_excel(file.file)
-    df.replace({np.nan: None}, inplace=True)
-    
-    existing_buyers = {buyer.identifier: buyer for buyer in db.query(Buyer).all()}
-    
-    updated_count = 0
-    added_count = 0
-    
-    for _, row in df.iterrows():
-        identifier_value = row.get("Identifier")
-        if identifier_value is None or pd.isna(identifier_value):
-            identifier_value = 0
-        
-        identifier_int = int(identifier_value)
-        name_str = str(row.get("Name", ""))
-        
-        if identifier_int in existing_buyers:
-            existing_buyer = existing_buyers[identifier_int]
-            if existing_buyer.name != name_str:
-                existing_buyer.name = name_str
-                updated_count += 1
-        else:
-            buyer = Buyer(
-                identifier=identifier_int,
-                name=name_str
-            )
-            db.add(buyer)
-            added_count += 1
-    
-    db.commit()
+    progress = _upload_progress_reporter("Buyer list upload")
+    added_count, updated_count, disabled_status = await run_db(
+        _import_buyer_list_file, file, db, progress, write=True
+    )
     message = f"Buyer list processed: {added_count} added, {updated_count} updated"
     logger.info(message)
 
-    buyer_sync_status = get_or_create_fairentry_sync_status(db, "buyers")
-    if buyer_sync_status.sync_enabled:
-        buyer_sync_status.sync_enabled = False
-        db.commit()
+    if disabled_status:
         disable_message = "Buyer auto-sync disabled: manual Buyer List upload took precedence"
         logger.info(disable_message)
-        await broadcast_message({"type": "fairentry_buyers_sync_status", **status_to_dict(buyer_sync_status)})
+        await broadcast_message({"type": "fairentry_buyers_sync_status", **disabled_status})
         await broadcast_message({"type": "log", "message": disable_message})
 
     await broadcast_state(db)
     await broadcast_message({"type": "log", "message": message})
     return {"message": message, "added": added_count, "updated": updated_count}
 
+def _listing_response(page: Page):
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if page.review_version is not None:
+        headers["X-Review-Version"] = str(page.review_version)
+    if page.rows is None:
+        return Response(status_code=304, headers=headers)
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    return JSONResponse(page.rows, headers=headers)
+
 @app.get("/api/sale")
-async def get_sale(db: Session = Depends(get_db)):
-    lots = ordered_lots(db).all()
-    return [
-        {
-            "LotNumber": lot.lot_number,
-            "StudentName": lot.student_name,
-            "Department": lot.department
-        }
-        for lot in lots
-    ]
+async def get_sale(request: Request, limit: int | None = None, cursor: str | None = None, department: str | None = None,
+                   lot_from: str | None = None, lot_to: str | None = None, q: str | None = None,
+                   db: Session = Depends(get_db)):
+    """The active Sale Program in lot order. With `limit`, one page of it -
+    pass the X-Next-Cursor header back as `cursor` for the next."""
+    page = await run_db(sale_page, db, request.headers.get("if-none-match"), limit, cursor,
+                        department, lot_from, lot_to, q)
+    return _listing_response(page)
 
 @app.get("/api/review/lots")
-async def get_review_lots(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+async def get_review_lots(request: Request, limit: int | None = None, cursor: str | None = None,
+                          department: str | None = None, lot_from: str | None = None, lot_to: str | None = None,
+                          q: str | None = None, since: int | None = None,
+                          db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     """Full sale program with every lot's recorded bidders, for the /reviewer
     screen. Read-only and unrelated to AuctionSession.current_lot_index -
-    navigation on that screen is a purely local frontend index."""
-    lots = ordered_lots(db).all()
-    lot_ids = [lot.id for lot in lots]
-    rows = (
-        db.query(BidderLot, Buyer)
-        .join(Buyer, BidderLot.buyer_id == Buyer.id)
-        .filter(BidderLot.lot_id.in_(lot_ids))
-        .all()
-    )
-    bidders_by_lot = {}
-    for bidder_lot, buyer in rows:
-        bidders_by_lot.setdefault(bidder_lot.lot_id, []).append(
-            {"Identifier": buyer.identifier, "Name": buyer.name}
-        )
-    return [
-        {
-            "LotNumber": lot.lot_number,
-            "StudentName": lot.student_name,
-            "Department": lot.department,
-            "Bidders": bidders_by_lot.get(lot.id, []),
-        }
-        for lot in lots
-    ]
+    navigation on that screen is a purely local frontend index. Takes the
+    same paging and filters as /api/sale.
+
+    The X-Review-Version header is the change version the lots are at; with
+    `since` set to one, only the lots changed after it come back, as
+    {"version", "reset", "lots"}."""
+    if since is not None:
+        return await run_db(review_changes, db, since, department, lot_from, lot_to, q)
+    page = await run_db(review_page, db, request.headers.get("if-none-match"), limit, cursor,
+                        department, lot_from, lot_to, q)
+    return _listing_response(page)
 
 @app.get("/api/buyers")
-async def get_buyers(db: Session = Depends(get_db)):
-    buyers = db.query(Buyer).all()
-    return [
-        {
-            "Identifier": buyer.identifier,
-            "Name": buyer.name
-        }
-        for buyer in buyers
-    ]
-
-@app.get("/api/fairentry/connection")
-async def get_fairentry_connection_endpoint(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    connection = get_or_create_fairentry_connection(db)
-    return connection_to_dict(connection)
-
-@app.post("/api/fairentry/connection")
-async def update_fairentry_connection(request: FairEntryConnectionRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+async def get_buyers(request: Request, limit: int | None = None, cursor: str | None = None, q: str | None = None,
+                     db: Session = Depends(get_db)):
+    page = await run_db(buyer_page, db, request.headers.get("if-none-match"), limit, cursor, q)
+    return _listing_response(page)
+
+def _check_search_limit(limit: int):
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SEARCH_RESULTS}")
+
+@app.get("/api/buyers/search")
+async def search_buyers(q: str = "", limit: int = 10, db: Session = Depends(get_db)):
+    """Bidder-entry autocomplete: buyers whose number starts with `q`, or
+    whose name matches it word by word. Served from memory, so it's cheap
+    enough to call on every keystroke."""
+    _check_search_limit(limit)
+    await _ensure_live_state(db)
+    return {"query": q, "results": live_state.search_buyers(q, limit)}
+
+def _connection_settings(db: Session):
+    return connection_to_dict(get_or_create_fairentry_connection(db))
+
+def _update_connection(db: Session, request: FairEntryConnectionRequest):
     connection = get_or_create_fairentry_connection(db)
     connection.username = request.username
     connection.fair_title = request.fair_title
     if request.password:
         connection.password_encrypted = encrypt_password(request.password)
     db.commit()
+    return connection_to_dict(connection)
+
+@app.get("/api/fairentry/connection")
+async def get_fairentry_connection_endpoint(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    # get_or_create_* may insert the row, so these go through the writer.
+    return await run_db(_connection_settings, db, write=True)
+
+@app.post("/api/fairentry/connection")
+async def update_fairentry_connection(request: FairEntryConnectionRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    connection = await run_db(_update_connection, db, request, write=True)
+    # Pooled clients are logged in with the old credentials.
+    reset_client_pool()
+    # Auto-syncs skipped for lack of credentials can go ahead now rather
+    # than at their next retry.
+    wake_sync_scheduler("buyers")
+    wake_sync_scheduler("sale")
 
     await broadcast_message({"type": "log", "message": "FairEntry connection settings updated"})
-    return connection_to_dict(connection)
+    return connection
+
+def _sync_status(db: Session, target: str):
+    return status_to_dict(get_or_create_fairentry_sync_status(db, target))
+
+def _update_sync_status(db: Session, target: str, changes: dict):
+    status = get_or_create_fairentry_sync_status(db, target)
+    for field, value in changes.items():
+        setattr(status, field, value)
+    db.commit()
+    return status_to_dict(status)
 
 @app.get("/api/fairentry/sync/{target}")
 async def get_fairentry_sync_status(target: str, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     if target not in VALID_SYNC_TARGETS:
         raise HTTPException(status_code=404, detail=f"Unknown sync target '{target}'")
-    status = get_or_create_fairentry_sync_status(db, target)
-    return status_to_dict(status)
+    return await run_db(_sync_status, db, target, write=True)
 
 @app.post("/api/fairentry/sync/{target}/interval")
 async def update_fairentry_sync_interval(target: str, request: FairEntrySyncIntervalRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     if target not in VALID_SYNC_TARGETS:
         raise HTTPException(status_code=404, detail=f"Unknown sync target '{target}'")
-    status = get_or_create_fairentry_sync_status(db, target)
-    status.sync_interval_minutes = request.sync_interval_minutes
-    db.commit()
+    changes = {"sync_interval_minutes": request.sync_interval_minutes}
+    status = await run_db(_update_sync_status, db, target, changes, write=True)
+    wake_sync_scheduler(target)
 
-    await broadcast_message({"type": f"fairentry_{target}_sync_status", **status_to_dict(status)})
-    return status_to_dict(status)
+    await broadcast_message({"type": f"fairentry_{target}_sync_status", **status})
+    return status
 
 @app.post("/api/fairentry/sync/{target}/toggle")
 async def toggle_fairentry_sync(target: str, request: FairEntrySyncToggleRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     if target not in VALID_SYNC_TARGETS:
         raise HTTPException(status_code=404, detail=f"Unknown sync target '{target}'")
-    status = get_or_create_fairentry_sync_status(db, target)
-    status.sync_enabled = request.enabled
+    changes = {"sync_enabled": request.enabled}
     if request.enabled:
-        status.consecutive_failures = 0
-    db.commit()
+        changes["consecutive_failures"] = 0
+    status = await run_db(_update_sync_status, db, target, changes, write=True)
 
     message = f"FairEntry {target} auto-sync {'enabled' if request.enabled else 'disabled'}"
-    await broadcast_message({"type": f"fairentry_{target}_sync_status", **status_to_dict(status)})
+    await broadcast_message({"type": f"fairentry_{target}_sync_status", **status})
     await broadcast_message({"type": "log", "message": message})
 
     if request.enabled:
         await VALID_SYNC_TARGETS[target](db)
+        status = await run_db(_sync_status, db, target, write=True)
+    # Only now, so the scheduler counts from the sync that just ran rather
+    # than queueing a second one behind it.
+    wake_sync_scheduler(target)
 
-    return status_to_dict(status)
+    return status
 
 @app.post("/api/fairentry/sync/{target}/now")
 async def sync_fairentry_now(target: str, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
@@ -327,182 +399,255 @@ async def sync_fairentry_now(target: str, db: Session = Depends(get_db), user: d
     result = await VALID_SYNC_TARGETS[target](db)
     return result
 
+def _sale_order_options(db: Session):
+    return [sale_order_option_to_dict(option) for option in db.query(FairEntrySaleOrderOption).all()]
+
 @app.get("/api/fairentry/sale-orders")
 async def get_fairentry_sale_orders(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    options = db.query(FairEntrySaleOrderOption).all()
-    return [sale_order_option_to_dict(option) for option in options]
+    return await run_db(_sale_order_options, db)
 
 @app.post("/api/fairentry/sale-orders/refresh")
 async def refresh_fairentry_sale_orders(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     return await refresh_sale_order_options(db)
 
+def _select_sale_order(db: Session, sale_order_id: int):
+    status_dict = select_sale_order(db, sale_order_id)
+    # Cached rows for the newly-selected Sale Order (if it's been synced
+    # before) become the active list immediately.
+    live_state.reload(db)
+    return status_dict
+
 @app.post("/api/fairentry/sale-orders/select")
 async def select_fairentry_sale_order(request: SaleOrderSelectRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    status_dict = select_sale_order(db, request.sale_order_id)
+    status_dict = await run_db(_select_sale_order, db, request.sale_order_id, write=True)
+    wake_sync_scheduler("sale")
     await broadcast_message({"type": "fairentry_sale_sync_status", **status_dict})
     await broadcast_message({"type": "log", "message": f"Sale Order selection updated: {status_dict.get('selected_sale_order_name')}"})
-    # Cached rows for the newly-selected Sale Order (if it's been synced
-    # before) become the active list immediately - push that out to every
-    # client (admin Sale List, public display, auctioneer) right away rather
-    # than waiting for their next lot-navigation event.
+    # Push the newly-active list out to every client (admin Sale List, public
+    # display, auctioneer) right away rather than waiting for their next
+    # lot-navigation event.
     await broadcast_message({"type": "sale_updated"})
     await broadcast_state(db)
     return status_dict
 
 @app.get("/api/state")
 async def get_current_state(db: Session = Depends(get_db)):
-    session = get_or_create_session(db)
-
-    current_lot = ordered_lots(db).offset(session.current_lot_index).first()
-    if not current_lot:
-        return {"lot": None, "bidders": [], "theme": session.theme}
-
-    lot_info = {
-        "LotNumber": current_lot.lot_number,
-        "StudentName": current_lot.student_name,
-        "Department": current_lot.department
-    }
+    await _ensure_live_state(db)
+    if live_state.verify:
+        await run_db(live_state.check_consistency, db)
+    return live_state.snapshot()
 
-    bidders = db.query(BidderLot).filter(BidderLot.lot_id == current_lot.id).all()
-    bidder_info = []
-    for bidder in bidders:
-        buyer = db.query(Buyer).filter(Buyer.id == bidder.buyer_id).first()
-        if buyer:
-            bidder_info.append({"Identifier": buyer.identifier, "Name": buyer.name})
-
-    return {"lot": lot_info, "bidders": bidder_info, "theme": session.theme}
+def _apply_theme(db: Session, theme: str):
+    live_state.ensure_loaded(db)
+    session = get_or_create_session(db)
+    session.theme = theme
+    db.commit()
+    live_state.set_theme(theme)
 
 @app.post("/api/theme")
 async def set_theme(request: ThemeRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     if request.theme not in ALLOWED_THEMES:
         raise HTTPException(status_code=400, detail=f"Unknown theme '{request.theme}'")
 
-    session = get_or_create_session(db)
-    session.theme = request.theme
-    db.commit()
+    await run_db(_apply_theme, db, request.theme, write=True)
 
     await broadcast_state(db)
     return {"message": "Theme updated", "theme": request.theme}
 
-@app.post("/api/lot/next")
-async def next_lot(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+def _move_current_lot(db: Session, step: int) -> bool:
+    """Move the current lot `step` lots forward (or back). Returns False,
+    changing nothing, if that would run off either end of the sale."""
+    live_state.ensure_loaded(db)
     session = get_or_create_session(db)
-    total_lots = ordered_lots(db).count()
-    
-    if session.current_lot_index + 1 < total_lots:
-        session.current_lot_index += 1
-        db.commit()
-        
+    index = session.current_lot_index + step
+    if not 0 <= index < live_state.lot_count:
+        return False
+
+    set_current_lot(session, index, live_state.lots[index]["id"])
+    db.commit()
+    live_state.set_current_lot_index(index)
+    return True
+
+async def _step_lot(db: Session, step: int) -> dict:
+    if await run_db(_move_current_lot, db, step, write=True):
         await broadcast_state(db)
-        return {"message": "Advanced to next lot"}
-    return {"message": "End of lots"}
+        return {"message": "Advanced to next lot" if step > 0 else "Moved to previous lot"}
+    return {"message": "End of lots" if step > 0 else "Start of lots"}
+
+@app.post("/api/lot/next")
+async def next_lot(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    return await _step_lot(db, 1)
 
 @app.post("/api/lot/prev")
 async def prev_lot(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    session = get_or_create_session(db)
+    return await _step_lot(db, -1)
+
+def _take_bid(lot: dict, lot_index: int, identifier: int):
+    """Journal and show buyer `identifier` as a bidder on `lot` - the DB
+    catches up on the next bid journal flush, which also creates the buyer
+    if it's new. Returns (buyer dict, buyer was unknown), or None if they're
+    already recorded on it. Call with live_state.lock held."""
+    if live_state.has_bidder(lot["id"], identifier):
+        return None
+    name = live_state.buyer_name(identifier)
+    created = name is None
+    if created:
+        name = f"Buyer {identifier}"
+    bid_journal.append(lot["id"], lot_index, identifier, name)
+    live_state.add_bidder(lot["id"], identifier, name)
+    return {"Identifier": identifier, "Name": name}, created
+
+def _record_bid(identifier: int):
+    """Record buyer `identifier` as a bidder on the current lot, checked
+    against the live state rather than the DB. Returns (lot, buyer dict,
+    seq) for the broadcast, or None if they were already recorded on it."""
+    with live_state.lock:
+        current_lot = live_state.current_lot
+        if not current_lot:
+            raise HTTPException(status_code=404, detail="No current lot")
+        taken = _take_bid(current_lot, live_state.current_lot_index, identifier)
+        if taken is None:
+            return None
+        return current_lot, taken[0], live_state.seq
+
+async def _add_bidder(db: Session, identifier: int) -> dict:
+    await _ensure_live_state(db)
+    recorded = _record_bid(identifier)
+    if recorded:
+        current_lot, bidder, seq = recorded
+        if WS_DELTA_FRAMES:
+            await broadcast_message({
+                "type": "bidder_added",
+                "seq": seq,
+                "LotNumber": current_lot["LotNumber"],
+                "bidder": bidder,
+            })
+        else:
+            await broadcast_state(db, bid_update=True)
+        await broadcast_message({"type": "log", "message": f"Bidder {identifier} added."})
     
-    if session.current_lot_index > 0:
-        session.current_lot_index -= 1
-        db.commit()
-        
-        await broadcast_state(db)
-        return {"message": "Moved to previous lot"}
-    return {"message": "Start of lots"}
+    return {"message": "Bidder added"}
 
 @app.post("/api/bidder/add/{identifier}")
 async def add_bidder(identifier: int, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    session = get_or_create_session(db)
-
-    current_lot = ordered_lots(db).offset(session.current_lot_index).first()
-    if not current_lot:
-        raise HTTPException(status_code=404, detail="No current lot")
-
-    buyer = db.query(Buyer).filter(Buyer.identifier == identifier).first()
-    if not buyer:
-        buyer = Buyer(identifier=identifier, name=f"Buyer {identifier}")
-        db.add(buyer)
-        db.commit()
-        db.refresh(buyer)
-    
-    existing_bid = db.query(BidderLot).filter(
-        BidderLot.lot_id == current_lot.id,
-        BidderLot.buyer_id == buyer.id
-    ).first()
-    
-    if not existing_bid:
-        bid = BidderLot(
-            lot_id=current_lot.id,
-            buyer_id=buyer.id,
-            lot_index=session.current_lot_index
-        )
-        db.add(bid)
-        db.commit()
-        
+    return await _add_bidder(db, identifier)
+
+def _record_bids(identifiers: list, lot_number: str | None):
+    """_record_bid() for a whole row of bidder numbers, on the current lot or
+    the lot numbered `lot_number`. Returns (lot, per-identifier results,
+    number added)."""
+    with live_state.lock:
+        if lot_number is None:
+            lot, lot_index = live_state.current_lot, live_state.current_lot_index
+            if not lot:
+                raise HTTPException(status_code=404, detail="No current lot")
+        else:
+            found = live_state.find_lot(lot_number)
+            if found is None:
+                raise HTTPException(status_code=404, detail=f"Lot {lot_number} not found")
+            lot_index, lot = found
+
+        results, added = [], 0
+        for identifier in identifiers:
+            taken = _take_bid(lot, lot_index, identifier)
+            if taken is None:
+                results.append({"identifier": identifier, "status": "duplicate"})
+                continue
+            bidder, created = taken
+            results.append({"identifier": identifier, "status": "added", "name": bidder["Name"], "buyer_created": created})
+            added += 1
+        return lot, results, added
+
+async def _add_bidders(db: Session, request: BidderBatchRequest) -> dict:
+    """Add several bidders to one lot in one go, with a single broadcast."""
+    if not request.identifiers:
+        raise HTTPException(status_code=400, detail="No bidder numbers given")
+    await _ensure_live_state(db)
+    lot, results, added = _record_bids(request.identifiers, request.lot_number)
+    if added:
         await broadcast_state(db, bid_update=True)
-        await broadcast_message({"type": "log", "message": f"Bidder {identifier} added."})
-    
-    return {"message": "Bidder added"}
+        added_identifiers = ", ".join(str(result["identifier"]) for result in results if result["status"] == "added")
+        await broadcast_message({"type": "log", "message": f"Bidders {added_identifiers} added to lot {lot['LotNumber']}."})
+    return {"lot_number": lot["LotNumber"], "added": added, "results": results}
 
-@app.get("/api/export/bidders")
-async def export_bidders(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    export_data = []
-    lots = ordered_lots(db).all()
-    
-    for lot in lots:
-        bidders = db.query(BidderLot).filter(BidderLot.lot_id == lot.id).all()
-        buyer_names = []
-        for bidder in bidders:
-            buyer = db.query(Buyer).filter(Buyer.id == bidder.buyer_id).first()
-            if buyer:
-                buyer_names.append(str(buyer.identifier))
-        
-        export_data.append({
-            "LotNumber": lot.lot_number,
-            "StudentName": lot.student_name,
-            "Department": lot.department,
-            "Buyers": ", ".join(buyer_names)
-        })
-    
-    df_export = pd.DataFrame(export_data)
-    df_export.replace({np.nan: None}, inplace=True)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_export.to_excel(writer, index=False)
-    output.seek(0)
-    return StreamingResponse(output, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={"Content-Disposition": "attachment; filename=auction_bidders.xlsx"})
+@app.post("/api/bidder/add")
+async def add_bidders(request: BidderBatchRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    return await _add_bidders(db, request)
 
+@app.get("/api/export/bidders")
+async def export_bidders(format: str = "xlsx", db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Export format must be 'xlsx' or 'csv'")
+    export_file = await run_db(open_bidders_export, db, format)
+    return StreamingResponse(
+        iter_export(export_file),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="auction_bidders.{format}"',
+            "Content-Length": str(os.fstat(export_file.fileno()).st_size),
+        },
+    )
 
-@app.post("/api/bidder/undo")
-async def undo_bidder(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
-    """Remove the last bidder from the current lot."""
-    session = get_or_create_session(db)
 
-    current_lot = ordered_lots(db).offset(session.current_lot_index).first()
+def _undo_last_bid(db: Session):
+    """Delete the current lot's most recent bid. Returns (lot, buyer
+    identifier or None if the buyer row is gone, seq)."""
+    live_state.ensure_loaded(db)
+    current_lot = live_state.current_lot
     if not current_lot:
         raise HTTPException(status_code=404, detail="No current lot")
 
     last_bidder = db.query(BidderLot).filter(
-        BidderLot.lot_id == current_lot.id
+        BidderLot.lot_id == current_lot["id"]
     ).order_by(BidderLot.created_at.desc()).first()
     
     if not last_bidder:
         raise HTTPException(status_code=404, detail="No bidders to undo for this lot")
     
     buyer = db.query(Buyer).filter(Buyer.id == last_bidder.buyer_id).first()
-    buyer_identifier = buyer.identifier if buyer else "Unknown"
+    buyer_identifier = buyer.identifier if buyer else None
     
     db.delete(last_bidder)
+    mark_lots_changed(db, [current_lot["id"]])
     db.commit()
+    if buyer_identifier is None:
+        live_state.reload(db)
+    else:
+        live_state.remove_bidder(current_lot["id"], buyer_identifier)
+    return current_lot, buyer_identifier, live_state.seq
+
+async def _undo_bidder(db: Session) -> dict:
+    """Remove the last bidder from the current lot."""
+    current_lot, buyer_identifier, seq = await run_db(_undo_last_bid, db, write=True)
     
-    await broadcast_state(db)
-    await broadcast_message({"type": "log", "message": f"Undid bidder {buyer_identifier} from lot {current_lot.lot_number}"})
+    if WS_DELTA_FRAMES and buyer_identifier is not None:
+        await broadcast_message({
+            "type": "bidder_removed",
+            "seq": seq,
+            **_review_version_field(),
+            "LotNumber": current_lot["LotNumber"],
+            "Identifier": buyer_identifier,
+        })
+    else:
+        await broadcast_state(db)
+    if buyer_identifier is None:
+        buyer_identifier = "Unknown"
+    await broadcast_message({"type": "log", "message": f"Undid bidder {buyer_identifier} from lot {current_lot['LotNumber']}"})
     
     return {"message": f"Undid bidder {buyer_identifier}"}
 
+@app.post("/api/bidder/undo")
+async def undo_bidder(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    return await _undo_bidder(db)
+
 class MergeRequest(BaseModel):
     source_identifier: int
     target_identifier: int
 
+class MergeManyRequest(BaseModel):
+    source_identifiers: list[int]
+    target_identifier: int
+
 class CreateUserRequest(BaseModel):
     username: str
     password: str
@@ -511,51 +656,76 @@ class ChangePasswordRequest(BaseModel):
     username: str
     new_password: str
 
+def _merge_buyers(db: Session, source_identifiers: list[int], target_identifier: int) -> dict:
+    """Fold every source buyer into the target in one transaction. A source
+    bid on a lot the target (or an earlier source bid) already has is
+    dropped; the rest are repointed at the target."""
+    source_identifiers = list(dict.fromkeys(source_identifiers))
+    if target_identifier in source_identifiers:
+        raise HTTPException(status_code=400, detail="Cannot merge bidder with itself")
+
+    buyer_ids = dict(db.execute(
+        select(Buyer.identifier, Buyer.id).where(Buyer.identifier.in_(source_identifiers + [target_identifier]))
+    ).all())
+    missing = [identifier for identifier in source_identifiers if identifier not in buyer_ids]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Source bidder {', '.join(map(str, missing))} not found")
+    if target_identifier not in buyer_ids:
+        raise HTTPException(status_code=404, detail=f"Target bidder {target_identifier} not found")
+
+    target_id = buyer_ids[target_identifier]
+    source_ids = [buyer_ids[identifier] for identifier in source_identifiers]
+    mark_buyer_lots_changed(db, source_ids)
+    other = aliased(BidderLot)
+    duplicate = select(other.id).where(
+        other.lot_id == BidderLot.lot_id,
+        or_(other.buyer_id == target_id, and_(other.buyer_id.in_(source_ids), other.id < BidderLot.id)),
+    ).exists()
+    dropped = db.execute(delete(BidderLot).where(BidderLot.buyer_id.in_(source_ids), duplicate)).rowcount
+    moved = db.execute(update(BidderLot).where(BidderLot.buyer_id.in_(source_ids)).values(buyer_id=target_id)).rowcount
+    db.execute(delete(Buyer).where(Buyer.id.in_(source_ids)))
+    # A buyer sync would otherwise skip re-creating the merged-away buyers.
+    get_or_create_fairentry_sync_status(db, "buyers").payload_fingerprint = None
+    db.commit()
+    live_state.reload(db)
+    return {"merged": source_identifiers, "moved_bids": moved, "dropped_bids": dropped}
+
 @app.post("/api/bidder/merge")
 async def merge_bidders(merge_request: MergeRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     """Merge two bidder records."""
-    source_buyer = db.query(Buyer).filter(Buyer.identifier == merge_request.source_identifier).first()
-    target_buyer = db.query(Buyer).filter(Buyer.identifier == merge_request.target_identifier).first()
-    
-    if not source_buyer:
-        raise HTTPException(status_code=404, detail=f"Source bidder {merge_request.source_identifier} not found")
-    if not target_buyer:
-        raise HTTPException(status_code=404, detail=f"Target bidder {merge_request.target_identifier} not found")
-    
-    if source_buyer.id == target_buyer.id:
-        raise HTTPException(status_code=400, detail="Cannot merge bidder with itself")
-    
-    source_bids = db.query(BidderLot).filter(BidderLot.buyer_id == source_buyer.id).all()
-    
-    for bid in source_bids:
-        existing_target_bid = db.query(BidderLot).filter(
-            BidderLot.lot_id == bid.lot_id,
-            BidderLot.buyer_id == target_buyer.id
-        ).first()
-        
-        if existing_target_bid:
-            db.delete(bid)
-        else:
-            bid.buyer_id = target_buyer.id
-    
-    db.delete(source_buyer)
-    db.commit()
+    await run_db(_merge_buyers, db, [merge_request.source_identifier], merge_request.target_identifier, write=True)
     
     await broadcast_state(db)
     await broadcast_message({"type": "log", "message": f"Merged bidder {merge_request.source_identifier} into {merge_request.target_identifier}"})
     
     return {"message": f"Merged bidder {merge_request.source_identifier} into {merge_request.target_identifier}"}
 
+@app.post("/api/bidder/merge/batch")
+async def merge_many_bidders(merge_request: MergeManyRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
+    """Merge several duplicate bidder records into one, all or nothing."""
+    if not merge_request.source_identifiers:
+        raise HTTPException(status_code=400, detail="No source bidders given")
+    result = await run_db(_merge_buyers, db, merge_request.source_identifiers, merge_request.target_identifier, write=True)
+
+    sources = ", ".join(map(str, result["merged"]))
+    await broadcast_state(db)
+    await broadcast_message({"type": "log", "message": f"Merged bidders {sources} into {merge_request.target_identifier}"})
+
+    return {"message": f"Merged bidders {sources} into {merge_request.target_identifier}", **result}
+
+def _user_rows(db: Session):
+    return [{"username": u.username, "created_at": u.created_at} for u in get_all_users(db)]
+
 @app.get("/api/users")
 async def get_users(db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     """Get all users."""
-    users = get_all_users(db)
-    return [{"username": u.username, "created_at": u.created_at} for u in users]
+    return await run_db(_user_rows, db)
 
 @app.post("/api/users")
 async def create_new_user(request: CreateUserRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     """Create a new admin user."""
-    if create_user(request.username, request.password, db):
+    password_hash = await run_bcrypt(get_password_hash, request.password)
+    if await run_db(create_user, request.username, password_hash, db, write=True):
         await broadcast_message({"type": "log", "message": f"Created new admin user: {request.username}"})
         return {"message": f"User {request.username} created successfully"}
     else:
@@ -564,7 +734,8 @@ async def create_new_user(request: CreateUserRequest, db: Session = Depends(get_
 @app.post("/api/users/change-password")
 async def change_password(request: ChangePasswordRequest, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     """Change password for a user."""
-    if change_user_password(request.username, request.new_password, db):
+    password_hash = await run_bcrypt(get_password_hash, request.new_password)
+    if await run_db(change_user_password, request.username, password_hash, db, write=True):
         await broadcast_message({"type": "log", "message": f"Password changed for user: {request.username}"})
         return {"message": f"Password changed for {request.username}"}
     else:
@@ -573,47 +744,160 @@ async def change_password(request: ChangePasswordRequest, db: Session = Depends(
 @app.delete("/api/users/{username}")
 async def delete_user_endpoint(username: str, db: Session = Depends(get_db), user: dict = Depends(require_auth)):
     """Delete a user."""
-    if delete_user(username, db):
+    if await run_db(delete_user, username, db, write=True):
         await broadcast_message({"type": "log", "message": f"Deleted user: {username}"})
         return {"message": f"User {username} deleted successfully"}
     else:
         raise HTTPException(status_code=400, detail="Cannot delete user (user not found, or this is the last remaining account)")
 
+@app.get("/api/metrics")
+async def get_metrics(user: dict = Depends(require_auth)):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled; set METRICS_ENABLED=1")
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+def _require_profiling():
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILING_ENABLED=1")
+
+@app.get("/api/profiling")
+async def get_profiling(user: dict = Depends(require_auth)):
+    _require_profiling()
+    return profiling_report()
+
+@app.post("/api/profiling/capture")
+async def start_profile_capture(request: ProfileCaptureRequest, user: dict = Depends(require_auth)):
+    _require_profiling()
+    if not 0 < request.seconds <= MAX_CAPTURE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Capture length must be between 0 and {MAX_CAPTURE_SECONDS} seconds")
+    try:
+        # The sampler sleeps between samples for the whole window - keep it
+        # off the loop (and off the DB pools) so it sees normal traffic.
+        return await asyncio.to_thread(capture_profile, request.seconds)
+    except CaptureInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
-    websockets.append(ws)
-    logger.info(f"WS connected, total clients={len(websockets)}")
+    connect(ws)
+    logger.info(f"WS connected, total clients={client_count()}")
+    # What this socket has authenticated as - see _handle_ws_request.
+    connection = {"token": None}
     try:
         while True:
-            await ws.receive_text()
+            await _handle_ws_request(ws, connection, await ws.receive_text())
     except Exception as e:
-        logger.info(f"WS disconnected ({e!r}), total clients={len(websockets) - 1}")
-        websockets.remove(ws)
+        disconnect(ws)
+        logger.info(f"WS disconnected ({e!r}), total clients={client_count()}")
 
-async def broadcast_state(db: Session, bid_update=False):
-    session = get_or_create_session(db)
-
-    current_lot = ordered_lots(db).offset(session.current_lot_index).first()
-
-    lot_info = None
-    bidder_info = []
-    if current_lot:
-        lot_info = {
-            "LotNumber": current_lot.lot_number,
-            "StudentName": current_lot.student_name,
-            "Department": current_lot.department
-        }
+async def _load_live_state():
+    db = SessionLocal()
+    try:
+        await _ensure_live_state(db)
+    finally:
+        db.close()
+
+async def _run_ws_command(request: dict) -> dict:
+    """The endpoint behind a console command, with its own DB session the
+    way get_db() gives each HTTP request one."""
+    command = request.get("command")
+    db = SessionLocal()
+    try:
+        if command == "next":
+            return await _step_lot(db, 1)
+        if command == "prev":
+            return await _step_lot(db, -1)
+        if command == "undo":
+            return await _undo_bidder(db)
+        if command == "add":
+            try:
+                batch = BidderBatchRequest(identifiers=request.get("identifiers"), lot_number=request.get("lot_number"))
+            except ValidationError:
+                raise HTTPException(status_code=400, detail="identifiers must be a list of bidder numbers")
+            if len(batch.identifiers) == 1 and batch.lot_number is None:
+                return await _add_bidder(db, batch.identifiers[0])
+            return await _add_bidders(db, batch)
+        raise HTTPException(status_code=400, detail=f"Unknown command {command!r}")
+    finally:
+        db.close()
+
+async def _handle_ws_command(ws: WebSocket, connection: dict, request: dict):
+    result = {"type": "command_result", "id": request.get("id")}
+    # Checked on every command, not just at auth time, so a token that
+    # expires mid-connection stops working - the cache makes it cheap.
+    if connection["token"] is None or decode_token(connection["token"]) is None:
+        send_to(ws, {**result, "ok": False, "status": 401, "detail": "Could not validate credentials"})
+        return
+    try:
+        response = await _run_ws_command(request)
+    except HTTPException as e:
+        send_to(ws, {**result, "ok": False, "status": e.status_code, "detail": e.detail})
+        return
+    except Exception:
+        logger.exception(f"WS command {request.get('command')!r} failed")
+        send_to(ws, {**result, "ok": False, "status": 500, "detail": "Internal Server Error"})
+        return
+    send_to(ws, {**result, "ok": True, "response": response})
+
+async def _handle_ws_request(ws: WebSocket, connection: dict, text: str):
+    """Requests a client sends up its socket, each answered to that client
+    alone and tagged with the request's id. Anything unrecognised is ignored,
+    as all client frames were.
+
+    - buyer_search: the same lookup as /api/buyers/search without an HTTP
+      round trip per keystroke.
+    - auth: {token} - the console's login token, checked once per
+      connection instead of on every request.
+    - command: {command: next | prev | add | undo, identifiers, lot_number}
+      - the lot and bidder endpoints for an authenticated socket, run one
+      at a time in the order sent. The broadcasts they cause go out as
+      usual, so the client sees the new state the same way every display
+      does."""
+    try:
+        request = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(request, dict):
+        return
+    if request.get("type") == "auth":
+        token = request.get("token")
+        ok = isinstance(token, str) and decode_token(token) is not None
+        connection["token"] = token if ok else None
+        send_to(ws, {"type": "auth_result", "id": request.get("id"), "ok": ok})
+        return
+    if request.get("type") == "command":
+        await _handle_ws_command(ws, connection, request)
+        return
+    if request.get("type") != "buyer_search":
+        return
+    try:
+        limit = min(max(int(request.get("limit", 10)), 1), MAX_SEARCH_RESULTS)
+    except (TypeError, ValueError):
+        limit = 10
+    if not live_state.loaded:
+        await _load_live_state()
+    send_to(ws, {
+        "type": "buyer_search_results",
+        "id": request.get("id"),
+        "results": live_state.search_buyers(str(request.get("q", "")), limit),
+    })
+
+def _review_version_field() -> dict:
+    """The review change version for a frame - reviewers already at it skip
+    the fetch. Left out while bids wait in the journal: they have no version
+    yet, so only a fetch can tell a reviewer about them."""
+    if bid_journal.has_pending():
+        return {}
+    return {"review_version": review_version()}
 
-        bidders = db.query(BidderLot).filter(BidderLot.lot_id == current_lot.id).all()
-        for bidder in bidders:
-            buyer = db.query(Buyer).filter(Buyer.id == bidder.buyer_id).first()
-            if buyer:
-                bidder_info.append({"Identifier": buyer.identifier, "Name": buyer.name})
+async def broadcast_state(db: Session, bid_update=False):
+    await _ensure_live_state(db)
+    if live_state.verify:
+        await run_db(live_state.check_consistency, db)
 
     message_type = "bid_update" if bid_update else "state"
-    state = {"type": message_type, "lot": lot_info, "bidders": bidder_info, "theme": session.theme}
-    await broadcast_message(state)
+    await broadcast_message({"type": message_type, **_review_version_field(), **live_state.snapshot()})
 
 @app.get("/{full_path:path}")
 async def serve_spa(full_path: str):
@@ -0,0 +1,199 @@
+"""Hot-path instrumentation, exposed in Prometheus text format at
+/api/metrics. Off unless METRICS_ENABLED is set: the request middleware and
+SQL listeners are only installed when it is, and every other hook returns on
+its first line, so a deployment without it pays next to nothing."""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+# Observations come from the event loop and the DB worker threads alike.
+_lock = threading.Lock()
+_registry = []
+
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name, self.help_text, self.labels = name, help_text, labels
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{_label_text(self.labels, label_values)} {value}"
+
+
+class Gauge:
+    """A value read at scrape time from `read()`."""
+
+    def __init__(self, name: str, help_text: str, read):
+        self.name, self.help_text, self.read = name, help_text, read
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels, self.buckets = name, help_text, labels, buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values):
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        """Observe the time spent in the `with` block, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        bucket_labels = self.labels + ("le",)
+        for label_values, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_label_text(bucket_labels, label_values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_label_text(self.labels, label_values)} {count}"
+
+
+http_requests = Counter("adbackend_http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_request_seconds = Histogram("adbackend_http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+db_queries = Counter("adbackend_db_queries_total", "SQL statements executed.")
+db_query_seconds = Counter("adbackend_db_query_seconds_total", "Time spent executing SQL statements.")
+db_queries_per_request = Histogram("adbackend_db_queries_per_request", "SQL statements executed per HTTP request.",
+                                   ("route",), QUERY_COUNT_BUCKETS)
+db_seconds_per_request = Histogram("adbackend_db_query_seconds_per_request", "Time in SQL per HTTP request.", ("route",))
+broadcast_seconds = Histogram("adbackend_broadcast_fan_out_seconds",
+                              "Time to encode a frame and queue it for every client.", ("type",))
+broadcast_frames = Counter("adbackend_broadcast_frames_total", "Frames queued for clients.", ("type",))
+ws_send_lag_seconds = Histogram("adbackend_ws_send_lag_seconds",
+                                "Time from a frame being queued for a client to its send completing.")
+ws_connects = Counter("adbackend_ws_connects_total", "WebSocket clients connected.")
+ws_disconnects = Counter("adbackend_ws_disconnects_total", "WebSocket clients disconnected or dropped.")
+sync_phase_seconds = Histogram("adbackend_fairentry_sync_phase_seconds",
+                               "FairEntry sync time by phase: auth (login), fetch (one upstream call), apply (DB write).",
+                               ("target", "phase"))
+
+
+def render_metrics() -> str:
+    with _lock:
+        lines = [line for metric in _registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+class _RequestDB:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# The current request's SQL tally. run_db() copies the context into the DB
+# worker thread, so statements run there are counted against the request.
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def count_queries(engine):
+    """Count and time every statement on `engine`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        db_queries.inc()
+        db_query_seconds.inc(amount=elapsed)
+        request_db = _request_db.get()
+        if request_db is not None:
+            request_db.queries += 1
+            request_db.seconds += elapsed
+
+
+class MetricsMiddleware:
+    """Per-route latency, status and SQL tallies. Plain ASGI rather than
+    BaseHTTPMiddleware so file responses stream straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        request_db = _RequestDB()
+        token = _request_db.set(request_db)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            # The route template, not the raw path, keeps label cardinality
+            # bounded (/api/bidder/add/{identifier}, not one series per bidder).
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests.inc(scope["method"], route, status)
+            http_request_seconds.observe(elapsed, scope["method"], route)
+            db_queries_per_request.observe(request_db.queries, route)
+            db_seconds_per_request.observe(request_db.seconds, route)
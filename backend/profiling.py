@@ -0,0 +1,243 @@
+"""Opt-in profiling for working out why the screens lag mid-sale. With
+PROFILING_ENABLED set:
+
+- every request slower than PROFILING_SLOW_REQUEST_MS is logged and kept
+  with a breakdown: each SQL statement and its time, time spent fanning out
+  broadcasts, and the total;
+- any single statement slower than PROFILING_SLOW_QUERY_MS is logged, in or
+  out of a request;
+- capture_profile() samples every thread's stack for a while, for the cases
+  where the time isn't in SQL at all (bcrypt, pandas, JSON encoding).
+
+The last PROFILING_BUFFER_SIZE slow requests and captures are kept in memory
+for /api/profiling. Nothing here is installed when profiling is off."""
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+logger = logging.getLogger("adbackend")
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILING_SLOW_REQUEST_MS = float(os.getenv("PROFILING_SLOW_REQUEST_MS", "250"))
+PROFILING_SLOW_QUERY_MS = float(os.getenv("PROFILING_SLOW_QUERY_MS", "100"))
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", "50"))
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+MAX_CAPTURE_SECONDS = 60
+# Per-trace and per-capture caps, so one pathological request can't hold
+# megabytes of SQL text in the ring buffer.
+MAX_TRACE_STATEMENTS = 200
+MAX_STATEMENT_CHARS = 500
+TOP_STACKS = 40
+TOP_FUNCTIONS = 30
+
+# Leaf frames of a thread with nothing to do: the event loop in select(),
+# pool workers blocked on their queue, threads parked on a lock.
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+slow_requests = deque(maxlen=PROFILING_BUFFER_SIZE)
+captures = deque(maxlen=PROFILING_BUFFER_SIZE)
+_capture_lock = threading.Lock()
+_capture_ids = iter(range(1, sys.maxsize))
+
+
+class CaptureInProgress(Exception):
+    """Only one sampling capture runs at a time."""
+
+
+class _Trace:
+    __slots__ = ("statements", "sql_count", "sql_seconds", "broadcast_count", "broadcast_seconds")
+
+    def __init__(self):
+        self.statements = []
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.broadcast_count = 0
+        self.broadcast_seconds = 0.0
+
+
+# The current request's trace; run_db() carries it into the DB worker threads.
+_trace = contextvars.ContextVar("profiling_trace", default=None)
+
+
+def note_broadcast(seconds: float):
+    """Charge a broadcast fan-out to the request that triggered it."""
+    if not PROFILING_ENABLED:
+        return
+    trace = _trace.get()
+    if trace is not None:
+        trace.broadcast_count += 1
+        trace.broadcast_seconds += seconds
+
+
+def trace_queries(engine):
+    """Time every statement on `engine` for the current trace, and log the
+    slow ones."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiling_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profiling_query_start"].pop()
+        if elapsed * 1000 >= PROFILING_SLOW_QUERY_MS:
+            logger.warning(f"Slow SQL ({elapsed * 1000:.0f}ms): {statement[:MAX_STATEMENT_CHARS]}")
+        trace = _trace.get()
+        if trace is None:
+            return
+        trace.sql_count += 1
+        trace.sql_seconds += elapsed
+        if len(trace.statements) < MAX_TRACE_STATEMENTS:
+            trace.statements.append({
+                "sql": statement[:MAX_STATEMENT_CHARS],
+                "ms": round(elapsed * 1000, 2),
+                "executemany": executemany,
+            })
+
+
+class ProfilingMiddleware:
+    """Keeps the breakdown of every request over the slow threshold."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # A capture request blocks for its whole window by design - don't
+        # let it crowd the real slow requests out of the buffer.
+        if scope["type"] != "http" or scope["path"].startswith("/api/profiling"):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        trace = _Trace()
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _trace.reset(token)
+            if elapsed * 1000 >= PROFILING_SLOW_REQUEST_MS:
+                _record_slow_request(scope, status, elapsed, trace)
+
+
+def _record_slow_request(scope, status: int, elapsed: float, trace: _Trace):
+    path = scope["path"] + (f"?{scope['query_string'].decode()}" if scope.get("query_string") else "")
+    total_ms = elapsed * 1000
+    sql_ms = trace.sql_seconds * 1000
+    broadcast_ms = trace.broadcast_seconds * 1000
+    logger.warning(
+        f"Slow request {scope['method']} {path}: {total_ms:.0f}ms "
+        f"({trace.sql_count} SQL statement(s) in {sql_ms:.0f}ms, {broadcast_ms:.0f}ms in broadcasts)"
+    )
+    slow_requests.append({
+        "at": datetime.utcnow().isoformat() + "Z",
+        "method": scope["method"],
+        "path": path,
+        "route": getattr(scope.get("route"), "path", None),
+        "status": status,
+        "total_ms": round(total_ms, 1),
+        "sql_count": trace.sql_count,
+        "sql_ms": round(sql_ms, 1),
+        "broadcast_count": trace.broadcast_count,
+        "broadcast_ms": round(broadcast_ms, 1),
+        # Time in neither - Python work, waiting on the DB writer queue, bcrypt...
+        "other_ms": round(total_ms - sql_ms - broadcast_ms, 1),
+        "statements": trace.statements,
+    })
+
+
+def _frame_label(frame) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def capture_profile(seconds: float) -> dict:
+    """Sample every other thread's stack each SAMPLE_INTERVAL_SECONDS for
+    `seconds`, skipping idle ones, and keep the aggregate in `captures`.
+    Blocks for the whole window - run it off the event loop. Raises
+    CaptureInProgress if another capture is running."""
+    if not _capture_lock.acquire(blocking=False):
+        raise CaptureInProgress("A profile capture is already running")
+    try:
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = idle_samples = 0
+        started_at = datetime.utcnow()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    idle_samples += 1
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                stacks[(thread_names.get(ident, str(ident)), ";".join(reversed(labels)))] += 1
+            samples += 1
+            time.sleep(SAMPLE_INTERVAL_SECONDS)
+
+        self_counts, total_counts = Counter(), Counter()
+        for (_, stack), count in stacks.items():
+            functions = stack.split(";")
+            self_counts[functions[-1]] += count
+            for function in set(functions):
+                total_counts[function] += count
+
+        capture = {
+            "id": next(_capture_ids),
+            "started_at": started_at.isoformat() + "Z",
+            "seconds": seconds,
+            "interval_ms": SAMPLE_INTERVAL_SECONDS * 1000,
+            "samples": samples,
+            "busy_samples": sum(stacks.values()),
+            "idle_samples": idle_samples,
+            "functions": [
+                {"function": function, "self": count, "total": total_counts[function]}
+                for function, count in self_counts.most_common(TOP_FUNCTIONS)
+            ],
+            "stacks": [
+                {"thread": thread, "stack": stack, "samples": count}
+                for (thread, stack), count in stacks.most_common(TOP_STACKS)
+            ],
+        }
+        captures.append(capture)
+        logger.info(f"Profile capture {capture['id']}: {samples} samples over {seconds}s")
+        return capture
+    finally:
+        _capture_lock.release()
+
+
+def profiling_report() -> dict:
+    """Everything /api/profiling shows, newest first."""
+    return {
+        "slow_request_ms": PROFILING_SLOW_REQUEST_MS,
+        "slow_query_ms": PROFILING_SLOW_QUERY_MS,
+        "capturing": _capture_lock.locked(),
+        "slow_requests": list(reversed(slow_requests)),
+        "captures": list(reversed(captures)),
+    }
@@ -1,15 +1,189 @@
+import asyncio
+import json
 import logging
+import os
+import time
+from collections import deque
+
+import metrics
+import profiling
 
 logger = logging.getLogger("adbackend")
 
-websockets = []
+# Frames a client may have queued before it counts as a slow consumer.
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# What to do with a slow consumer whose queue is full: "drop_oldest" discards
+# its oldest queued state frame (a newer one supersedes it anyway), while
+# "disconnect" drops the client so it reconnects and re-fetches /api/state.
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+# Bursts of state frames closer together than this are coalesced: the first
+# goes out immediately, later ones are held and only the newest is sent when
+# the window closes. 0 sends every frame.
+WS_COALESCE_WINDOW_MS = int(os.getenv("WS_COALESCE_WINDOW_MS", "50"))
+# Announce single-bidder changes with small bidder_added/bidder_removed
+# frames instead of a full bid_update snapshot.
+WS_DELTA_FRAMES = os.getenv("WS_DELTA_FRAMES", "").lower() in ("1", "true", "yes")
 
+# Full-snapshot frames - any one of them makes every earlier one redundant.
+STATE_FRAME_TYPES = {"state", "bid_update"}
 
-async def broadcast_message(message):
-    logger.info(f"Broadcasting type={message.get('type')} to {len(websockets)} client(s)")
-    for ws in list(websockets):
+clients = {}
+
+# asyncio only holds weak references to tasks - keep the fire-and-forget
+# close() calls alive until they finish.
+_closing_tasks = set()
+
+_pending_state = None
+_coalesce_timer = None
+
+
+class _Client:
+    """One connected socket plus its bounded send queue, drained by its own
+    task so a stalled display only ever delays itself."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self._drain())
+
+    def enqueue(self, message_type, text) -> bool:
+        """Queue an encoded frame. Returns False if the client is too far
+        behind to keep and should be disconnected."""
+        if len(self.queue) >= WS_SEND_QUEUE_SIZE:
+            if WS_SLOW_CLIENT_POLICY != "drop_oldest" or not self._drop_oldest_state_frame():
+                return False
+        self.queue.append((message_type, text, time.perf_counter()))
+        self.ready.set()
+        return True
+
+    def _drop_oldest_state_frame(self) -> bool:
+        for index, (message_type, _, _) in enumerate(self.queue):
+            if message_type in STATE_FRAME_TYPES:
+                del self.queue[index]
+                return True
+        return False
+
+    async def _drain(self):
         try:
-            await ws.send_json(message)
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    _, text, queued_at = self.queue.popleft()
+                    await self.ws.send_text(text)
+                    metrics.ws_send_lag_seconds.observe(time.perf_counter() - queued_at)
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.info(f"Broadcast send failed ({e!r}), dropping client")
-            websockets.remove(ws)
+            disconnect(self.ws)
+
+
+def connect(ws):
+    """Register an accepted socket for broadcasts."""
+    clients[ws] = _Client(ws)
+    metrics.ws_connects.inc()
+
+
+def disconnect(ws, close=False):
+    """Stop broadcasting to a socket. Safe to call more than once."""
+    client = clients.pop(ws, None)
+    if not client:
+        return
+    metrics.ws_disconnects.inc()
+    client.task.cancel()
+    if close:
+        task = asyncio.create_task(_close(ws))
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+
+
+async def _close(ws):
+    try:
+        await ws.close()
+    except Exception:
+        pass
+
+
+def client_count() -> int:
+    return len(clients)
+
+
+metrics.Gauge("adbackend_ws_clients", "WebSocket clients currently connected.", client_count)
+
+
+async def broadcast_message(message):
+    """Encode once and hand the frame to every client's queue. Never waits
+    on a socket, so the caller's latency doesn't depend on the slowest
+    display."""
+    global _pending_state
+
+    if message.get("type") in STATE_FRAME_TYPES and WS_COALESCE_WINDOW_MS > 0:
+        if _coalesce_timer is not None:
+            _pending_state = message
+            return
+        _fan_out(message)
+        _open_coalesce_window()
+        return
+
+    # Delta frames are sequenced against the snapshots - never let one
+    # overtake a snapshot that's still being held back.
+    if "seq" in message:
+        _flush_pending_state()
+    _fan_out(message)
+
+
+def send_to(ws, message):
+    """Send a frame to one client only, such as a reply to its request. It
+    goes through that client's queue, so it stays in order with the
+    broadcasts around it."""
+    client = clients.get(ws)
+    if client is None:
+        return
+    message_type = message.get("type")
+    if not client.enqueue(message_type, json.dumps(message, separators=(",", ":"), ensure_ascii=False)):
+        logger.info(f"Client send queue full ({WS_SEND_QUEUE_SIZE} frames), disconnecting slow client")
+        disconnect(ws, close=True)
+
+
+def broadcast_threadsafe(loop, message):
+    """broadcast_message() for code running in a worker thread."""
+    asyncio.run_coroutine_threadsafe(broadcast_message(message), loop)
+
+
+def _open_coalesce_window():
+    global _coalesce_timer
+    _coalesce_timer = asyncio.get_running_loop().call_later(
+        WS_COALESCE_WINDOW_MS / 1000, _close_coalesce_window
+    )
+
+
+def _close_coalesce_window():
+    global _coalesce_timer
+    _coalesce_timer = None
+    if _pending_state is not None:
+        _flush_pending_state()
+        _open_coalesce_window()
+
+
+def _flush_pending_state():
+    global _pending_state
+    if _pending_state is not None:
+        message, _pending_state = _pending_state, None
+        _fan_out(message)
+
+
+def _fan_out(message):
+    started = time.perf_counter()
+    message_type = message.get("type")
+    logger.info(f"Broadcasting type={message_type} to {len(clients)} client(s)")
+    text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+    for ws, client in list(clients.items()):
+        if not client.enqueue(message_type, text):
+            logger.info(f"Client send queue full ({WS_SEND_QUEUE_SIZE} frames), disconnecting slow client")
+            disconnect(ws, close=True)
+    elapsed = time.perf_counter() - started
+    metrics.broadcast_frames.inc(message_type, amount=len(clients))
+    metrics.broadcast_seconds.observe(elapsed, message_type)
+    profiling.note_broadcast(elapsed)
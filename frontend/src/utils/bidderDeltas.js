@@ -0,0 +1,18 @@
+// With WS_DELTA_FRAMES on, the backend announces a single bidder change
+// with a bidder_added/bidder_removed frame instead of a full bid_update.
+// Every snapshot (state, bid_update, /api/state) and every delta carries the
+// live state's `seq`; a delta only applies on top of the frame right before it.
+
+export function isBidderDelta(data) {
+  return data.type === 'bidder_added' || data.type === 'bidder_removed';
+}
+
+// Returns the updated bidder list (unchanged if the delta is already
+// reflected in `seq`), or null when frames were missed and the caller has
+// to re-fetch /api/state.
+export function applyBidderDelta(bidders, seq, data) {
+  if (seq === null || data.seq > seq + 1) return null;
+  if (data.seq <= seq) return bidders;
+  if (data.type === 'bidder_added') return [...bidders, data.bidder];
+  return bidders.filter((bidder) => bidder.Identifier !== data.Identifier);
+}